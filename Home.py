@@ -1,7 +1,8 @@
+import time
+run_started = time.perf_counter()
 import streamlit as st
 from credentials import USER_CREDENTIALS
-import time
-from dashboards import orders_dashboard, customer_dashboard, salesperformance_dashboard, customersatisfaction_dashboard, powerbi_dashboards
+import registry
 
 st.set_page_config(page_title="Main Dashboard", layout="wide")
 
@@ -62,18 +63,14 @@ def main_page():
     st.image("https://images.seeklogo.com/logo-png/40/1/amazon-logo-png_seeklogo-408548.png", width=400)
 
 
-# Sidebar Navigation
-dashboards_dict={
-    "Home": main_page,
-    "Orders Dashboard" : orders_dashboard.render,
-    "Customer Dashboard" : customer_dashboard.render,
-    "Product Sales Performance Dashboard" : salesperformance_dashboard.render,
-    "Customer Satisfaction Dashboard" : customersatisfaction_dashboard.render,
-    "Power BI Dashboards" : powerbi_dashboards.render
+# Sidebar Navigation, dashboard modules are only imported when their page is first opened
+dashboards_dict={"Home": main_page}
+dashboards_dict.update({name: None for name in registry.DASHBOARDS})
 
-}
 # Render the appropriate page
 if st.session_state["logged_in"]:
+    import profiling
+
     page = st.sidebar.radio("Go to", list(dashboards_dict.keys()))
 
     # Logout button
@@ -81,6 +78,82 @@ if st.session_state["logged_in"]:
         st.session_state["logged_in"] = False
         st.rerun()
 
-    dashboards_dict[page]()
+    if page != "Home":
+        # The data layer (pandas, Plotly, SQLAlchemy, Arrow) and its database connections are only
+        # needed once a dashboard is opened
+        import charts
+        import data
+        import db
+        import snapshot
+
+        # Pushdown queries the database directly and never reads the snapshot
+        if not data.PUSHDOWN:
+            if snapshot.ENABLED:
+                snapshot.start_scheduler()
+            data.start_refresher()
+
+        # Shared data cache status
+        # Which copy of the data this run is served from
+        stats = data.cache_stats()
+        if stats['age_seconds'] is not None:
+            st.sidebar.caption(f"Data version {stats['version']} | Loaded {stats['age_seconds']/60:,.0f} min ago"
+                               f"{' | Refreshing…' if stats['refreshing'] else ''}")
+            if stats['last_refresh_error']:
+                st.sidebar.caption(f"⚠️ Refresh failed, serving the previous version: {stats['last_refresh_error']}")
+
+        with st.sidebar.expander("Data cache"):
+            st.caption(f"Hits: {stats['hits']:,} | Misses: {stats['misses']:,}")
+            st.caption(f"Rows: {stats['rows']:,} | Memory: {stats['memory_bytes']/1048576:,.1f} MB")
+            if stats['shared']:
+                st.caption(f"Shared memory: this process is the {stats['shared']}")
+            views = data.views.stats()
+            st.caption(f"Cached views: {views['entries']:,} ({views['bytes']/1048576:,.1f} MB) | "
+                       f"Hits: {views['hits']:,} | Misses: {views['misses']:,}")
+            figures = charts.figures.stats()
+            st.caption(f"Cached figures: {figures['entries']:,} ({figures['bytes']/1048576:,.1f} MB) | "
+                       f"Hits: {figures['hits']:,} | Misses: {figures['misses']:,}")
+            pool = db.pool_stats()
+            st.caption(f"Connections: {pool['checked_out']} in use, {pool['idle']} idle | "
+                       f"Waits: {pool['waits']:,} ({pool['wait_avg']*1000:,.0f} ms avg) | "
+                       f"Connect: {pool['connect_avg']*1000:,.0f} ms avg")
+            if snapshot.ENABLED:
+                sync = snapshot.status()
+                st.caption(f"Snapshot: {sync['bytes']/1048576:,.1f} MB | Last sync: "
+                           f"{time.strftime('%H:%M:%S', time.localtime(sync['last_sync'])) if sync['last_sync'] else 'never'}")
+                if sync['last_error']:
+                    st.caption(f"⚠️ Sync failed, serving last snapshot: {sync['last_error']}")
+            if st.button("Refresh data"):
+                data.refresh()
+                st.rerun()
+
+    with st.sidebar.expander("Startup timings"):
+        startup = registry.timings()
+        st.caption(f"Worker uptime: {startup['uptime']:,.0f}s")
+        for name, seconds in startup['first_paint'].items():
+            st.caption(f"First paint, {name}: {seconds:.2f}s")
+        for name, seconds in startup['imports'].items():
+            st.caption(f"Import {name.split('.')[-1]}: {seconds:.2f}s")
+
+    # Rerun timings per stage and chart, for admins only
+    if st.session_state["username"] in profiling.ADMIN_USERS:
+        with st.sidebar.expander("Performance"):
+            timings = profiling.percentiles()
+            if timings:
+                st.dataframe([row for row in timings if row['page'] == page] or timings, hide_index=True)
+            capture = profiling.captures().get(page)
+            if capture and 'peak_bytes' in capture:
+                st.caption(f"Peak allocations, last run: {capture['peak_bytes']/1048576:,.1f} MB")
+            if capture and 'profile' in capture:
+                st.code(capture['profile'], language=None)
+            st.download_button("Export JSON", profiling.export_json(), "timings.json", "application/json")
+            st.download_button("Export CSV", profiling.export_csv(), "timings.csv", "text/csv")
+            if st.button("Reset timings"):
+                profiling.reset()
+                st.rerun()
+
+    with profiling.run(page):
+        (dashboards_dict[page] or registry.load(page))()
+    registry.record_paint(page, run_started)
 else:
-    login_page()
\ No newline at end of file
+    login_page()
+    registry.record_paint("Login", run_started)
\ No newline at end of file
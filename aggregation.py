@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+def _factorize(values):
+    # Codes in sorted key order, -1 for missing keys, like groupby(sort=True, dropna=True).
+    # Unused categories are fine, GroupCodes only keeps observed groups.
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy().astype(np.int64)
+        categories = values.cat.categories
+        if values.cat.ordered or categories.is_monotonic_increasing:
+            return codes, categories
+        order = categories.argsort()
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        return np.where(codes >= 0, rank[codes], -1), categories.take(order)
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int64), uniques
+
+
+class GroupCodes:
+    def __init__(self, frame, keys):
+        self.keys = keys
+        combined = np.zeros(len(frame), dtype=np.int64)
+        valid = np.ones(len(frame), dtype=bool)
+        levels = []
+        for key in keys:
+            codes, uniques = _factorize(frame[key])
+            size = max(len(uniques), 1)
+            valid &= codes >= 0
+            combined = combined * size + codes
+            levels.append((key, size, uniques))
+        combined = combined[valid]
+        space = int(np.prod([size for _, size, _ in levels]))
+        # Compact the combined codes to the observed groups only, in sorted key order
+        if space <= 4 * len(combined) + 1024:
+            observed = np.flatnonzero(np.bincount(combined, minlength=space))
+            remap = np.full(space, -1, dtype=np.int64)
+            remap[observed] = np.arange(len(observed))
+            inverse = remap[combined]
+        else:
+            observed, inverse = np.unique(combined, return_inverse=True)
+        self.valid = valid
+        self.codes = inverse
+        self.n_groups = len(observed)
+        self.index = {}
+        for key, size, uniques in reversed(levels):
+            self.index[key] = uniques.take(observed % size)
+            observed = observed // size
+
+
+# Runs several groupby aggregations over one frame, sharing group codes and partial sums
+class AggregationEngine:
+    def __init__(self, frame):
+        self.frame = frame
+        self._groups = {}
+        self._columns = {}
+        self._partials = {}
+
+    def groups(self, keys):
+        keys = tuple(keys)
+        if keys not in self._groups:
+            self._groups[keys] = GroupCodes(self.frame, list(keys))
+        return self._groups[keys]
+
+    def _values(self, keys, column):
+        # Float64 values of the rows that belong to a group, NaN where missing
+        groups = self.groups(keys)
+        if column not in self._columns:
+            self._columns[column] = self.frame[column].to_numpy(dtype='float64', na_value=np.nan)
+        values = self._columns[column]
+        return values if groups.valid.all() else values[groups.valid]
+
+    def _sum_count(self, keys, column):
+        if (keys, column) not in self._partials:
+            groups = self.groups(keys)
+            values = self._values(keys, column)
+            present = ~np.isnan(values)
+            if present.all():
+                sums = np.bincount(groups.codes, values, groups.n_groups)
+                counts = np.bincount(groups.codes, minlength=groups.n_groups)
+            else:
+                sums = np.bincount(groups.codes, np.where(present, values, 0), groups.n_groups)
+                counts = np.bincount(groups.codes, present, groups.n_groups).astype(np.int64)
+            self._partials[(keys, column)] = (sums, counts)
+        return self._partials[(keys, column)]
+
+    def _extreme(self, keys, column, func):
+        groups = self.groups(keys)
+        values = self._values(keys, column)
+        present = ~np.isnan(values)
+        result = np.full(groups.n_groups, -np.inf if func == "max" else np.inf)
+        (np.maximum if func == "max" else np.minimum).at(result, groups.codes[present], values[present])
+        result[np.isinf(result)] = np.nan
+        return result
+
+    def metric(self, keys, column, func):
+        keys = tuple(keys)
+        groups = self.groups(keys)
+        if func == "size":
+            return np.bincount(groups.codes, minlength=groups.n_groups)
+        if func in ("max", "min"):
+            return self._extreme(keys, column, func)
+        sums, counts = self._sum_count(keys, column)
+        if func == "sum":
+            return sums
+        if func == "count":
+            return counts
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts
+
+    def aggregate(self, keys, **metrics):
+        # metrics are named (column, func) pairs, as in DataFrame.groupby().agg()
+        groups = self.groups(keys)
+        result = pd.DataFrame({key: groups.index[key] for key in keys})
+        for name, (column, func) in metrics.items():
+            result[name] = self.metric(keys, column, func)
+        return result
+
+    def run(self, specs):
+        # specs maps an output name to (keys, {metric name: (column, func)})
+        return {name: self.aggregate(keys, **metrics) for name, (keys, metrics) in specs.items()}
@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# Top-level categories of the Amazon catalogue the dashboards were built for
+CATEGORIES = ["Electronics", "Computers&Accessories", "Home&Kitchen", "OfficeProducts", "MusicalInstruments",
+              "HomeImprovement", "Toys&Games", "Car&Motorbike", "Health&PersonalCare"]
+
+# Dashboard pages the benchmark runs; the Power BI page is only an iframe
+PAGES = ["Orders Dashboard", "Customer Dashboard", "Product Sales Performance Dashboard",
+         "Customer Satisfaction Dashboard"]
+
+
+class Catalogue:
+    # Products and customers scale with the number of order rows; popularity and spend are skewed
+    def __init__(self, rows, seed=0):
+        rng = np.random.default_rng(seed)
+        self.rng = rng
+
+        # Category tree: each sub_category3 leaf belongs to one path up to its category
+        paths = []
+        for category in CATEGORIES:
+            for i in range(rng.integers(3, 9)):
+                sub1 = f"{category}|Sub{i}"
+                for j in range(rng.integers(2, 6)):
+                    sub2 = f"{sub1}|Type{j}"
+                    for k in range(rng.integers(1, 5)):
+                        paths.append((category, sub1, sub2, f"{sub2}|Line{k}"))
+        paths = pd.DataFrame(paths, columns=['category', 'sub_category1', 'sub_category2', 'sub_category3'])
+        self.levels = {name: pd.Index(sorted(paths[name].unique())) for name in paths.columns}
+        self.leaf_codes = {name: self.levels[name].get_indexer(paths[name]) for name in paths.columns}
+
+        n_products = max(100, rows // 25)
+        n_users = max(50, rows // 4)
+        self.products = pd.Index([f"P{i:08d}" for i in range(n_products)])
+        self.users = pd.Index([f"U{i:09d}" for i in range(n_users)])
+        # A few products and customers account for most of the orders
+        self.product_weights = self._zipf(n_products, 1.1)
+        self.user_weights = self._zipf(n_users, 0.9)
+
+        self.product_leaf = rng.integers(0, len(paths), n_products)
+        self.product_price = np.round(rng.lognormal(6.3, 1.1, n_products)).astype('float32')
+        self.product_discount = np.round(rng.beta(2, 3, n_products), 2).astype('float32')
+        rating = np.round(np.clip(rng.normal(4.1, 0.35, n_products), 1, 5), 1)
+        rating[rng.random(n_products) < 0.02] = np.nan
+        self.product_rating = rating.astype('float32')
+        self.product_rating_count = np.minimum(rng.zipf(1.6, n_products), 500000)
+
+    def _zipf(self, n, exponent):
+        weights = 1 / np.arange(1, n + 1) ** exponent
+        return self.rng.permutation(weights / weights.sum())
+
+    def orders(self, rows, start=0):
+        product = self.rng.choice(len(self.products), rows, p=self.product_weights)
+        user = self.rng.choice(len(self.users), rows, p=self.user_weights)
+        leaf = self.product_leaf[product]
+        frame = {
+            'product_id': pd.Categorical.from_codes(product, self.products),
+            'user_id': pd.Categorical.from_codes(user, self.users),
+        }
+        for name, codes in self.leaf_codes.items():
+            frame[name] = pd.Categorical.from_codes(codes[leaf], self.levels[name])
+        frame.update({
+            'discount_percentage': self.product_discount[product],
+            'selling_price': self.product_price[product],
+            'rating': self.product_rating[product],
+            'rating_count': pd.array(self.product_rating_count[product], dtype='Int32'),
+            'last_modified': pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(start, start + rows), unit="s"),
+        })
+        return pd.DataFrame(frame)
+
+
+def generate(rows, seed=0, chunk_rows=1_000_000):
+    # Synthetic CleanedAmazonData, yielded chunk by chunk so large scales fit in memory
+    catalogue = Catalogue(rows, seed)
+    for start in range(0, rows, chunk_rows):
+        yield catalogue.orders(min(chunk_rows, rows - start), start)
+
+
+def write_snapshot(chunks, path):
+    import pyarrow as pa
+    writer = None
+    with pa.OSFile(path, "wb") as sink:
+        for chunk in chunks:
+            # Plain strings, as the snapshot sync would store them
+            batch = pa.Table.from_pandas(chunk.astype({name: 'str' for name in chunk.columns
+                                                      if isinstance(chunk[name].dtype, pd.CategoricalDtype)}),
+                                         preserve_index=False)
+            if writer is None:
+                writer = pa.ipc.new_file(sink, batch.schema)
+            writer.write_table(batch)
+        writer.close()
+
+
+def write_sqlite(chunks, path):
+    from sqlalchemy import create_engine
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for i, chunk in enumerate(chunks):
+            chunk.to_sql("CleanedAmazonData", conn, if_exists="replace" if i == 0 else "append", index=False,
+                         chunksize=100_000)
+    return engine
+
+
+def _prepare(args, workdir):
+    # Configures the data layer through its environment variables, so this runs before it is imported
+    chunks = generate(args.rows, args.seed)
+    if args.source == "snapshot":
+        path = os.path.join(workdir, "CleanedAmazonData.arrow")
+        write_snapshot(chunks, path)
+        os.environ.update(amazon_snapshot="true", amazon_snapshot_path=path)
+        return None
+    engine = write_sqlite(chunks, args.sqlite or os.path.join(workdir, "amazon.db"))
+    os.environ.update(amazon_snapshot="false", amazon_sql_pushdown=str(args.pushdown).lower())
+    return engine
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        engine = _prepare(args, workdir)
+        print(f"Generated {args.rows:,} rows in {time.perf_counter() - started:.1f}s ({args.source})")
+
+        import db
+        import streamlit.logger
+        if engine is not None:
+            # Local SQLite stand-in for the Azure SQL engine
+            db._instrument(engine)
+            db.get_engine = lambda: engine
+        import charts
+        import data
+        import profiling
+        import registry
+
+        # Streamlit calls run in bare mode here, without a browser session
+        streamlit.logger.set_log_level("error")
+        if args.memory:
+            tracemalloc.start()
+        from dashboards.base import Filters
+        renders = {page: registry.load(page) for page in args.pages}
+        modules = {page: sys.modules[registry.DASHBOARDS[page]] for page in args.pages}
+        if not data.PUSHDOWN:
+            columns = {}
+            for page in args.pages:
+                columns.update(modules[page].COLUMNS)
+            with profiling.run("(load)"):
+                data.load_orders(columns)
+        for page, render in renders.items():
+            for _ in range(args.repeat):
+                # Every repeat recomputes the page instead of serving the cached view
+                data.views.clear()
+                data._results.clear()
+                charts.figures.clear()
+                with profiling.run(page):
+                    if args.compute_only:
+                        modules[page].compute(data, Filters())
+                    else:
+                        render()
+        tracemalloc.stop()
+        if engine is not None:
+            engine.dispose()
+        return profiling.records()
+
+
+def summarize(records):
+    frame = pd.DataFrame(records)
+    return (frame.groupby(['page', 'stage'], sort=False)
+            .agg(runs=('ms', 'size'), p50_ms=('ms', 'median'), max_ms=('ms', 'max'), peak_mb=('peak_mb', 'max'))
+            .reset_index())
+
+
+def compare(summary, baseline, tolerance):
+    # Stages whose median got slower than the baseline by more than the tolerance
+    merged = summary.merge(baseline, on=['page', 'stage'], suffixes=('', '_baseline'))
+    merged['change'] = merged['p50_ms'] / merged['p50_ms_baseline'] - 1
+    # Sub-millisecond stages are too noisy to compare
+    return merged[(merged['change'] > tolerance) & (merged['p50_ms_baseline'] >= 1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboards on synthetic CleanedAmazonData")
+    parser.add_argument("--rows", type=int, default=100_000, help="order rows to generate, e.g. 10000 to 50000000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", choices=["snapshot", "sqlite"], default="snapshot",
+                        help="read through an Arrow snapshot, or a SQLite stand-in for the Azure SQL database")
+    parser.add_argument("--sqlite", help="keep the SQLite database at this path")
+    parser.add_argument("--pushdown", action="store_true", help="filter and aggregate in SQLite (needs --source sqlite)")
+    parser.add_argument("--page", dest="pages", action="append", choices=PAGES, help="pages to run (default all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compute-only", action="store_true",
+                        help="time each page's compute() alone, without building the figures")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip tracemalloc, which slows pandas code down")
+    parser.add_argument("--output", help="write the per-stage summary as JSON")
+    parser.add_argument("--compare", help="summary JSON from an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against --compare")
+    args = parser.parse_args(argv)
+    args.pages = args.pages or PAGES
+    if args.pushdown and args.source != "sqlite":
+        parser.error("--pushdown needs --source sqlite")
+
+    summary = summarize(run(args))
+    print(summary.to_string(index=False, float_format=lambda value: f"{value:,.1f}"))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"rows": args.rows, "source": args.source, "pushdown": args.pushdown,
+                       "stages": summary.to_dict("records")}, output, indent=1)
+    if args.compare:
+        with open(args.compare) as baseline:
+            slower = compare(summary, pd.DataFrame(json.load(baseline)["stages"]), args.tolerance)
+        if len(slower):
+            print(f"\nSlower than {args.compare} by more than {args.tolerance:.0%}:")
+            print(slower[['page', 'stage', 'p50_ms_baseline', 'p50_ms', 'change']].to_string(index=False))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
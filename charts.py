@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+from functools import partial
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+import parallel
+import regression
+from result_cache import ResultCache
+
+try:
+    # What st.plotly_chart uses to send a figure, so a serialized one can be sent as is
+    from streamlit.elements.lib.form_utils import current_form_id
+    from streamlit.elements.lib.layout_utils import LayoutConfig
+    from streamlit.elements.lib.utils import compute_and_register_element_id
+    from streamlit.elements.plotly_chart import _resolve_content_height, _resolve_content_width
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+except ImportError:
+    PlotlyChartProto = None
+
+logger = logging.getLogger(__name__)
+# Cleared when the Streamlit internals above turn out not to work as called here
+_direct = {"enabled": PlotlyChartProto is not None}
+
+# Above this many rows a scatter no longer sends one marker per row to the browser
+MAX_POINTS = int(os.getenv("amazon_scatter_max_points", "5000"))
+# "sample" plots a density-preserving sample, "histogram" a binned 2D histogram
+LARGE_MODE = os.getenv("amazon_scatter_mode", "sample")
+GRID_BINS = 40
+# Shade the 95% confidence band of the fitted mean around each trendline
+TRENDLINE_BANDS = os.getenv("amazon_trendline_bands", "false").lower() in ("1", "true", "yes")
+BAND_POINTS = 50
+# Upper bound for serialized figures kept per (chart, selection, data version)
+FIGURE_CACHE_BYTES = int(float(os.getenv("amazon_figure_cache_mb", "64")) * 1024 * 1024)
+
+figures = ResultCache(FIGURE_CACHE_BYTES)
+
+
+def density_sample(frame, x, y, n, seed=0):
+    # Stratified over a 2D grid: each occupied cell keeps its share of the sample,
+    # and at least one point, so sparse regions and outliers stay visible
+    xs = frame[x].to_numpy(dtype='float64', na_value=np.nan)
+    ys = frame[y].to_numpy(dtype='float64', na_value=np.nan)
+    cells = _bin(xs) * (GRID_BINS + 1) + _bin(ys)
+    order = np.lexsort((np.random.default_rng(seed).random(len(frame)), cells))
+    sorted_cells = cells[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    counts = np.diff(np.r_[starts, len(order)])
+    quota = np.maximum(1, np.round(counts * n / len(frame))).astype(np.int64)
+    rank = np.arange(len(order)) - np.repeat(starts, counts)
+    keep = order[rank < np.repeat(quota, counts)]
+    return frame.iloc[np.sort(keep)]
+
+
+def _bin(values):
+    # NaN falls into its own bin
+    low, high = np.nanmin(values), np.nanmax(values)
+    if not np.isfinite(low) or high == low:
+        return np.where(np.isnan(values), GRID_BINS, 0)
+    binned = np.floor((values - low) / (high - low) * (GRID_BINS - 1))
+    return np.where(np.isnan(values), GRID_BINS, binned).astype(np.int64)
+
+
+def trendline_trace(fit, x, y):
+    xs = np.array([fit["x_min"], fit["x_max"]])
+    return go.Scatter(
+        x=xs,
+        y=fit["intercept"] + fit["slope"] * xs,
+        mode='lines',
+        showlegend=False,
+        hovertemplate=(f"<b>OLS trendline</b><br>{y} = {fit['slope']:g} * {x} + {fit['intercept']:g}"
+                       f"<br>R<sup>2</sup>={fit['r2']:f}<br><br>{x}=%{{x}}<br>{y}=%{{y}} <b>(trend)</b><extra></extra>"),
+    )
+
+
+def band_traces(fit):
+    xs = np.linspace(fit["x_min"], fit["x_max"], BAND_POINTS)
+    lower, upper = regression.confidence_band(fit, xs)
+    style = dict(mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip')
+    return [
+        go.Scatter(x=xs, y=upper, **style),
+        go.Scatter(x=xs, y=lower, fill='tonexty', fillcolor='rgba(99, 110, 250, 0.2)', **style),
+    ]
+
+
+def scatter(frame, x, y, trendline=True, **kwargs):
+    # The trendline is always fitted on every row, only the markers are reduced
+    fit = regression.ols(frame[x], frame[y]) if trendline else None
+    if len(frame) > MAX_POINTS and LARGE_MODE == "histogram":
+        fig = px.density_heatmap(frame, x=x, y=y, nbinsx=GRID_BINS, nbinsy=GRID_BINS, title=kwargs.get('title'),
+                                 color_continuous_scale=kwargs.get('color_continuous_scale'))
+    else:
+        if len(frame) > MAX_POINTS:
+            frame = density_sample(frame, x, y, MAX_POINTS)
+        fig = px.scatter(frame, x=x, y=y, **kwargs)
+    if fit is not None:
+        if TRENDLINE_BANDS and fit["n"] > 2:
+            fig.add_traces(band_traces(fit))
+        fig.add_trace(trendline_trace(fit, x, y))
+    return fig
+
+
+def serialize(build, frames):
+    # Plotly JSON exactly as st.plotly_chart would send it, plus the layout size it reads
+    fig = build(frames)
+    return {"spec": pio.to_json(fig, validate=False),
+            "layout": {"width": fig.layout.width, "height": fig.layout.height}}
+
+
+def figure_specs(dashboard, filters, version, builders, frames, prebuilt=None):
+    # Serialized figures by name; only the ones not cached for this selection and version, and not
+    # prebuilt, are built
+    keys = {name: (dashboard, name, frozenset(filters.categories), frozenset(filters.subcategories), version)
+            for name in builders}
+    specs = {name: (prebuilt or {}).get(name) or figures.get(key) for name, key in keys.items()}
+    missing = {name: partial(serialize, builders[name], frames) for name, spec in specs.items() if spec is None}
+    for name, spec in parallel.run_all(missing, processes=True).items():
+        specs[name] = figures.put(keys[name], spec)
+    return specs
+
+
+def plotly_chart(container, figure, width="stretch", height="content"):
+    # st.plotly_chart for a figure from figure_specs(), without validating and serializing it again
+    if _direct["enabled"]:
+        try:
+            return _enqueue(container, figure, width, height)
+        except (TypeError, AttributeError, ValueError):
+            # streamlit is not pinned; from here on every chart goes through the public API
+            logger.exception("Sending a serialized figure failed, falling back to st.plotly_chart")
+            _direct["enabled"] = False
+    return container.plotly_chart(pio.from_json(figure["spec"]), width=width, height=height)
+
+
+def _enqueue(container, figure, width, height):
+    # Layout first: nothing is registered with the page until every internal has been called
+    layout = LayoutConfig(width=_resolve_content_width(width, figure), height=_resolve_content_height(height, figure))
+    proto = PlotlyChartProto()
+    proto.theme = "streamlit"
+    proto.form_id = current_form_id(container)
+    proto.spec = figure["spec"]
+    proto.config = json.dumps({})
+    proto.id = compute_and_register_element_id(
+        "plotly_chart", user_key=None, key_as_main_identity=False, dg=container, plotly_spec=proto.spec,
+        plotly_config=proto.config, selection_mode=("points", "box", "lasso"), is_selection_activated=False,
+        theme="streamlit", width=width, height=height, alt=None)
+    return container._enqueue("plotly_chart", proto, layout_config=layout)
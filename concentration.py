@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def _clean(values):
+    values = np.asarray(values, dtype='float64')
+    missing = np.isnan(values)
+    return values[~missing] if missing.any() else values
+
+
+def concentration(values, top=(), thresholds=(), with_gini=False, with_curve=False, total=None):
+    # top: item counts whose share of the total is wanted, e.g. (5, 20, 50)
+    # thresholds: shares of the total, e.g. (0.8,), answered with the number of items needed
+    # with_curve adds the cumulative share curve (largest items first) for Pareto/Lorenz charts
+    # total is the denominator for shares, the sum of values by default
+    values = _clean(values)
+    total = values.sum() if total is None else total
+    result = {"total": total, "items": len(values), "top_shares": {}, "items_for_share": {}, "gini": None,
+              "curve": None}
+    if not len(values) or not total:
+        result["top_shares"] = {n: 0.0 for n in top}
+        result["items_for_share"] = {share: 0 for share in thresholds}
+        return result
+
+    if thresholds or with_gini or with_curve:
+        # These need the whole curve, so sort once and read everything from it
+        ordered = np.sort(values)[::-1]
+    else:
+        # Only the top-K are needed: partial selection instead of a full sort
+        k = min(max(top, default=0), len(values))
+        if k <= 0:
+            result["top_shares"] = {n: 0.0 for n in top}
+            return result
+        ordered = np.sort(np.partition(values, len(values) - k)[len(values) - k:])[::-1]
+    cumulative = np.cumsum(ordered)
+
+    for n in top:
+        result["top_shares"][n] = float(cumulative[min(n, len(cumulative)) - 1] / total) if n > 0 else 0.0
+    for share in thresholds:
+        result["items_for_share"][share] = int(min(np.searchsorted(cumulative, share * total) + 1, len(values)))
+    if with_gini:
+        n = len(ordered)
+        # ordered is descending, so rank n - i for the i-th item in ascending order
+        ranks = np.arange(n, 0, -1)
+        result["gini"] = float(2 * np.sum(ranks * ordered) / (n * total) - (n + 1) / n)
+    if with_curve:
+        result["curve"] = cumulative / total
+    return result
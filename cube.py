@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import hll
+
+# Grain of the cube: every filter selection is a set of these cells
+KEYS = ['category', 'sub_category1']
+MEASURES = ['selling_price', 'discount_percentage', 'rating']
+DISTINCT = ['product_id', 'user_id']
+
+COLUMNS = {
+    'product_id': 'category',
+    'user_id': 'category',
+    'category': 'category',
+    'sub_category1': 'category',
+    'selling_price': 'float32',
+    'discount_percentage': 'float32',
+    'rating': 'float32',
+}
+
+
+class AggregateCube:
+    def __init__(self, cells, sketches):
+        self.cells = cells
+        self.sketches = sketches
+
+    @classmethod
+    def build(cls, frame):
+        grouped = frame.groupby(KEYS, observed=True, sort=True)
+        cells = grouped.size().rename('orders').reset_index()
+        # NaN for rows with a missing key, which makes the codes floats
+        codes = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        in_cell = codes >= 0
+        n_cells = len(cells)
+        for measure in MEASURES:
+            values = frame[measure].to_numpy(dtype='float64', na_value=np.nan)
+            present = in_cell & ~np.isnan(values)
+            cell, value = codes[present], values[present]
+            cells[f'{measure}_sum'] = np.bincount(cell, value, n_cells)
+            cells[f'{measure}_count'] = np.bincount(cell, minlength=n_cells)
+            cells[f'{measure}_sumsq'] = np.bincount(cell, value * value, n_cells)
+            maxima = np.full(n_cells, -np.inf)
+            np.maximum.at(maxima, cell, value)
+            cells[f'{measure}_max'] = np.where(np.isinf(maxima), np.nan, maxima)
+        sketches = {}
+        for column in DISTINCT:
+            hashes, present = hll.hash_values(frame[column])
+            present &= in_cell
+            sketches[column] = hll.sketch(codes[present], n_cells, hashes[present])
+        return cls(cells, sketches)
+
+    def _mask(self, category_selected, subcategory_selected):
+        # Same semantics as the sidebar: no category selected means every cell
+        if not category_selected:
+            return np.ones(len(self.cells), dtype=bool)
+        return (self.cells['category'].isin(category_selected) &
+                self.cells['sub_category1'].isin(subcategory_selected)).to_numpy()
+
+    def rollup(self, category_selected, subcategory_selected):
+        selected = self.cells[self._mask(category_selected, subcategory_selected)]
+        selected = selected[selected['orders'] > 0]
+        totals = selected.drop(columns=KEYS).sum()
+        kpis = {
+            "orders": int(totals['orders']),
+            "unique_categories": selected['category'].nunique(),
+            "unique_subcategories": selected['sub_category1'].nunique(),
+        }
+        for measure in MEASURES:
+            count = totals[f'{measure}_count']
+            mean = totals[f'{measure}_sum'] / count if count else np.nan
+            kpis[f'{measure}_sum'] = totals[f'{measure}_sum']
+            kpis[f'{measure}_mean'] = mean
+            kpis[f'{measure}_max'] = selected[f'{measure}_max'].max()
+            kpis[f'{measure}_std'] = np.sqrt(max(totals[f'{measure}_sumsq'] / count - mean * mean, 0)) if count else np.nan
+        return kpis
+
+    def by(self, level, category_selected, subcategory_selected):
+        selected = self.cells[self._mask(category_selected, subcategory_selected)]
+        partials = [column for column in self.cells.columns if column not in KEYS and not column.endswith('_max')]
+        grouped = selected.groupby(level, observed=True)
+        result = grouped[partials].sum()
+        for measure in MEASURES:
+            result[f'{measure}_max'] = grouped[f'{measure}_max'].max()
+            result[f'{measure}_mean'] = result[f'{measure}_sum'] / result[f'{measure}_count'].replace(0, np.nan)
+        return result[result['orders'] > 0].reset_index()
+
+    def distinct(self, column, category_selected, subcategory_selected):
+        # Approximate distinct count from the merged HyperLogLog sketches
+        registers = self.sketches[column][self._mask(category_selected, subcategory_selected)]
+        return hll.estimate(registers)
+
+    def distinct_by(self, column, level, category_selected, subcategory_selected):
+        # Approximate distinct counts per category or sub_category1, merging each group's cell sketches
+        mask = self._mask(category_selected, subcategory_selected)
+        cells = self.cells.loc[mask, level]
+        registers = self.sketches[column][mask]
+        groups = cells.groupby(cells, observed=True, sort=True).indices
+        return pd.DataFrame({
+            level: list(groups),
+            'distinct': [round(hll.estimate(registers[rows])) for rows in groups.values()],
+        })
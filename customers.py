@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+def _dense(codes, size):
+    # Codes in [0, size) renumbered to 0..n-1 over the values that occur, with those values
+    present = np.bincount(codes, minlength=size) > 0
+    used = np.flatnonzero(present)
+    lookup = np.cumsum(present) - 1
+    return lookup[codes], used
+
+
+def _pairs(user, cell, orders, revenue, n_users):
+    # Orders and revenue summed per distinct (customer, cell), in order of first appearance
+    index, pairs = pd.factorize(cell.astype(np.int64) * n_users + user)
+    return {
+        'user': (pairs % n_users).astype(np.int32),
+        'cell': (pairs // n_users).astype(np.int32),
+        'orders': np.bincount(index, orders, minlength=len(pairs)).astype(np.int64),
+        'revenue': np.bincount(index, revenue, minlength=len(pairs)),
+    }
+
+
+class CustomerStore:
+    # Orders and revenue per customer, in total and per (category, sub_category1) cell, held in arrays
+    # indexed by customer position. Repeat-customer KPIs for any sidebar selection are read from them
+    # without grouping the orders, and new orders are added on top of the previous version.
+    def __init__(self, users, positions, ids, rank, cells, orders, revenue, log, compacted, rows, lineage):
+        # Customer ids by position, the position of each id, the ids sorted, and each position's rank
+        # in that order. Each version has its own positions, so a version can be extended more than once.
+        self.users = users
+        self.positions = positions
+        self.ids = ids
+        self.rank = rank
+        # (category, sub_category1) of each cell; None for a missing value, which no selection matches
+        self.cells = cells
+        self.orders = orders
+        self.revenue = revenue
+        # Per (customer, cell) partial totals; a pair appears once per batch of orders it had orders in,
+        # until the log is compacted again after doubling in length
+        self.log = log
+        self.compacted = compacted
+        self.rows = rows
+        self.lineage = lineage
+
+    @classmethod
+    def build(cls, frame, lineage=None):
+        log = {'user': np.empty(0, np.int32), 'cell': np.empty(0, np.int32), 'orders': np.empty(0, np.int64),
+               'revenue': np.empty(0, np.float64)}
+        empty = cls(np.empty(0, object), {}, np.empty(0, object), np.empty(0, np.int64), [],
+                    np.empty(0, np.int64), np.empty(0, np.float64), log, 0, 0, None)
+        return empty.extend(frame, lineage)
+
+    def extend(self, frame, lineage=None):
+        # A new store with the orders in frame added; this one stays as it is for readers still using it
+        known = frame['user_id'].cat.codes.to_numpy() >= 0
+        frame = frame[known] if not known.all() else frame
+
+        # Customers: existing ones keep their position, new ones are appended
+        if self.positions is None:
+            # Not pickled with the store (see __getstate__), so rebuilt once for the first extend
+            self.users, self.ids = np.asarray(self.users, dtype=object), np.asarray(self.ids, dtype=object)
+            self.positions = dict(zip(self.users, range(len(self.users))))
+        user_values = frame['user_id'].cat
+        user_codes, used = _dense(user_values.codes.to_numpy().astype(np.int64), len(user_values.categories))
+        values = np.asarray(user_values.categories.take(used), dtype=object)
+        lookup = self.positions.get
+        position = np.array([lookup(value, -1) for value in values], dtype=np.int64)
+        new = values[position < 0]
+        # Categories come sorted from the loaded frame, so this rarely has to sort
+        if not pd.Index(new).is_monotonic_increasing:
+            new = np.sort(new)
+        users = np.concatenate([self.users, new])
+        position[position < 0] = len(self.users) + pd.Index(new).get_indexer(values[position < 0])
+        user = position[user_codes]
+        # Sorted ids and ranks are merged, not re-sorted
+        inserted = np.searchsorted(self.ids, new)
+        ids = np.insert(self.ids, inserted, new)
+        rank = np.concatenate([self.rank + np.searchsorted(inserted, self.rank, side='right'),
+                               inserted + np.arange(len(new))])
+
+        # Cells: the distinct (category, sub_category1) code pairs of this batch, looked up by value
+        category, sub_category = frame['category'].cat, frame['sub_category1'].cat
+        width = len(sub_category.categories) + 1
+        pair = ((category.codes.to_numpy().astype(np.int64) + 1) * width +
+                sub_category.codes.to_numpy().astype(np.int64) + 1)
+        pair_codes, used = _dense(pair, (len(category.categories) + 1) * width)
+        cells = list(self.cells)
+        cell_ids = {key: i for i, key in enumerate(cells)}
+        pair_cell = np.empty(len(used), np.int64)
+        for i, code in enumerate(used):
+            key = (category.categories[code // width - 1] if code // width else None,
+                   sub_category.categories[code % width - 1] if code % width else None)
+            if key not in cell_ids:
+                cell_ids[key] = len(cells)
+                cells.append(key)
+            pair_cell[i] = cell_ids[key]
+        cell = pair_cell[pair_codes]
+
+        # Missing prices add nothing to revenue, as in a groupby sum
+        price = np.nan_to_num(frame['selling_price'].to_numpy(dtype='float64', na_value=np.nan))
+        orders = np.bincount(user, minlength=len(users))
+        orders[:len(self.orders)] += self.orders
+        # bincount returns integers for an empty batch
+        revenue = np.bincount(user, price, minlength=len(users)).astype(np.float64)
+        revenue[:len(self.revenue)] += self.revenue
+
+        batch = _pairs(user, cell, np.ones(len(user), np.int64), price, len(users))
+        log = {name: np.concatenate([self.log[name], batch[name]]) for name in self.log}
+        # The first batch is already one entry per pair
+        compacted = self.compacted or len(log['user'])
+        if len(log['user']) > 2 * compacted:
+            log = _pairs(log['user'], log['cell'], log['orders'], log['revenue'], len(users))
+            compacted = len(log['user'])
+
+        positions = dict(self.positions)
+        positions.update(zip(new, range(len(self.users), len(users))))
+        return CustomerStore(users, positions, ids, rank, cells, orders, revenue, log, compacted,
+                             self.rows + len(known), lineage)
+
+    def __getstate__(self):
+        # Ids as Arrow strings, whose buffers pickle out of band (see shared.publish), and without
+        # the id -> position dict, which only extend() needs
+        state = dict(self.__dict__, positions=None)
+        state['users'] = pd.array(self.users, dtype='str')
+        state['ids'] = pd.array(self.ids, dtype='str')
+        return state
+
+    def totals(self, category_selected, subcategory_selected):
+        # Orders and revenue per customer position, with the sidebar's filter semantics
+        if not category_selected:
+            return self.orders, self.revenue
+        categories, subcategories = set(category_selected), set(subcategory_selected)
+        selected = np.array([category in categories and sub_category in subcategories
+                             for category, sub_category in self.cells], dtype=bool)
+        if selected.all():
+            return self.orders, self.revenue
+        keep = selected[self.log['cell']]
+        user = self.log['user'][keep]
+        orders = np.bincount(user, self.log['orders'][keep], minlength=len(self.users)).astype(np.int64)
+        revenue = np.bincount(user, self.log['revenue'][keep], minlength=len(self.users))
+        return orders, revenue
+
+    def repeat(self, category_selected, subcategory_selected, loyal=5):
+        # Repeat-customer KPIs, the revenue of every customer with an order in the selection, and the
+        # first `loyal` repeat customers in id order (as a groupby lists them)
+        orders, revenue = self.totals(category_selected, subcategory_selected)
+        repeat = np.flatnonzero(orders > 1)
+        first = repeat
+        if len(repeat) > loyal:
+            first = repeat[np.argpartition(self.rank[repeat], loyal)[:loyal]]
+        first = first[np.argsort(self.rank[first])]
+        active = orders > 0
+        return {
+            "customers": int(active.sum()),
+            "repeat_customers": len(repeat),
+            "repeat_revenue": revenue[repeat].sum(),
+            "revenue": revenue[active],
+            "loyal": pd.DataFrame({'user_id': np.asarray(self.users[first], dtype=object), 'order_count': orders[first],
+                                   'ordered_amount': revenue[first]}),
+        }
+
+
+def update(store, frame, lineage):
+    # Adds only the rows appended since the store was built, when the frame extends what it saw
+    if store is not None and lineage is not None and store.lineage == lineage and store.rows <= len(frame):
+        if store.rows == len(frame):
+            return store
+        return store.extend(frame.iloc[store.rows:], lineage)
+    return CustomerStore.build(frame, lineage)
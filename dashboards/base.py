@@ -0,0 +1,31 @@
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Filters:
+    # Sidebar selection; no category selected means no filter
+    categories: tuple = ()
+    subcategories: tuple = ()
+
+    @classmethod
+    def of(cls, categories, subcategories):
+        return cls(tuple(categories), tuple(subcategories))
+
+
+@dataclass
+class DashboardResult:
+    # Everything a page shows: KPI values by name, and the frame behind each chart by name.
+    # figures holds serialized figures by name when they were built ahead of time (see precompute.py)
+    kpis: dict[str, object] = field(default_factory=dict)
+    charts: dict[str, pd.DataFrame] = field(default_factory=dict)
+    figures: dict[str, dict] = field(default_factory=dict)
+
+
+def distinct_metric(kpis, name):
+    # Value and help text for st.metric; distinct counts are HyperLogLog estimates in approximate mode
+    error = kpis.get('distinct_error')
+    if error is None:
+        return f"{kpis[name]:,}", None
+    return f"≈{kpis[name]:,}", f"Estimated from HyperLogLog sketches, standard error ±{error:.1%}"
@@ -2,79 +2,77 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
-import statsmodels
-from db import get_engine
+import parallel
+from charts import figure_specs, plotly_chart
+from concentration import concentration
+import data
+from dashboards.base import DashboardResult, distinct_metric
+from dashboards.filters import sidebar_filters
+from profiling import stopwatch
 
-def render():
-    engine = get_engine()
-    amazon_orders = pd.read_sql("SELECT * FROM CleanedAmazonData", engine)
-  
-    st.set_page_config(layout="wide")
-    st.title("CUSTOMER DASHBOARD OF AMAZON")
+# Columns this page reads from CleanedAmazonData, with compact dtypes
+COLUMNS = {
+    'user_id': 'category',
+    'category': 'category',
+    'sub_category1': 'category',
+    'selling_price': 'float32',
+}
 
-    st.sidebar.header("Filters")
+def _category_customers(data, filtered, filters):
+    if data.APPROX_DISTINCT:
+        category_customers=data.distinct_by('user_id', 'category', filters.categories, filters.subcategories)
+    else:
+        category_customers=filtered.groupby(by='category', observed=True)['user_id'].nunique().reset_index()
+    category_customers.columns=['category', 'customer_base']
+    return category_customers.sort_values(by='customer_base')
 
-    # Category filter 
-    categories = amazon_orders['category'].unique().tolist()
-    categories.sort()
-    category_selected = st.sidebar.multiselect(
-        "Select Category",
-        options=categories,
-        default=categories  
-    )
 
-    # Subcategory filter depends on selected category
-    subcategories = amazon_orders[amazon_orders['category'].isin(category_selected)]['sub_category1'].unique().tolist()
-    subcategories.sort()
-    subcategory_selected = st.sidebar.multiselect(
-        "Select Subcategory",
-        options=subcategories,
-        default=subcategories  
-    )
+def _subcategory_customers(data, filtered, filters):
+    if data.APPROX_DISTINCT:
+        subcategory_customers=data.distinct_by('user_id', 'sub_category1', filters.categories, filters.subcategories)
+        subcategory_customers.columns=['sub_category1', 'customer_base']
+        return subcategory_customers.sort_values(by='customer_base').tail(5)
+    return filtered.groupby(by=
+                    'sub_category1', observed=True).agg(customer_base=('user_id','nunique')).sort_values(by='customer_base').reset_index().tail(5)
 
-    # Apply filters
-    if category_selected: 
-        filtered = amazon_orders[(amazon_orders['category'].isin(category_selected)) & 
-                                (amazon_orders['sub_category1'].isin(subcategory_selected))]
-    else:
-        filtered = amazon_orders.copy()
 
-    # KPIs
-    col1, col2, col3, col4 = st.columns(4)
-    col5, col6, col7, col8 =st.columns(4)
-    with col1:
-        st.metric("Unique Customers", f"{filtered['user_id'].nunique():,}")
+def compute(data, filters):
+    # Everything the page shows for one selection, without Streamlit
+    step = stopwatch()
+    filtered = data.filtered_orders(filters.categories, filters.subcategories, COLUMNS)
+    step('fetch')
 
-    customer_orders=filtered.groupby(by='user_id').agg(order_count=('user_id','count'), ordered_amount=('selling_price',
-                                                                                                         'sum')).reset_index()
-    customer_orders=customer_orders.loc[customer_orders['order_count']>1,:]
-    with col2:
-        st.metric("Repeated Customers", f"{customer_orders.shape[0]:,}")
-    with col3:
-        st.metric("Repeat Purchase Rate", f"{customer_orders.shape[0]/filtered['user_id'].nunique()*100:.2f}%")
-    with col4:
-        st.metric("Repeat Customer Revenue", f"₹{customer_orders ['ordered_amount'].sum()/1000000:.2f}M")
-    with col5:
-        st.metric("Repeat Customer Revenue %", f"{customer_orders ['ordered_amount'].sum()/filtered['selling_price'].sum()*100:.2f}%")
+    # Independent of each other; per-customer totals come from the customer store, not a groupby
+    parts = parallel.run_all({
+        'summary': lambda: data.summary(filtered, filters.categories, filters.subcategories),
+        'customers': lambda: data.repeat_customers(filtered, filters.categories, filters.subcategories),
+        'category_customers': lambda: _category_customers(data, filtered, filters),
+        'subcategory_customers': lambda: _subcategory_customers(data, filtered, filters),
+    })
+    kpis = parts['summary']
+    customers = parts['customers']
 
-    customer_wise_sales=filtered.groupby(by='user_id').agg(sales=('selling_price', 
-                                                                'sum')).sort_values(by='sales', ascending=False).reset_index()
-    customer_wise_sales.columns=['customer', 'sales']
-    top5=round(customer_wise_sales.head(5)['sales'].sum()/filtered['selling_price'].sum()*100, 2)
-    with col6:
-        st.metric("Top 5 Customers Share share", f"{top5}%")
-    
-    with col7:
-        st.metric("Maximum Ordered Amount", f"₹{filtered.groupby(by='user_id')['selling_price'].sum().max()/1000:.2f}K")
+    kpis['repeat_customers']=customers['repeat_customers']
+    kpis['repeat_revenue']=customers['repeat_revenue']
 
-    # Charts
-    c1, c2 = st.columns(2)
-    category_customers=filtered.groupby(by='category')['user_id'].nunique().reset_index()
-    category_customers.columns=['category', 'customer_base']
-    category_customers=category_customers.sort_values(by='customer_base')
+    shares=concentration(customers['revenue'], top=(5, 15, 50, 100), total=kpis['total_sales'])['top_shares']
+    kpis['top5']=round(shares[5]*100, 2)
+    kpis['max_ordered_amount']=customers['revenue'].max() if len(customers['revenue']) else np.nan
 
+    top_n=pd.DataFrame({'Top N': ['Top 15', 'Top 50', 'Top 100'], 'Sales Share':[round(shares[n]*100, 2) for n in (15, 50, 100)]})
+
+    step('shares')
+    return DashboardResult(kpis=kpis, charts={
+        'loyal_customers': customers['loyal'],
+        'category_customers': parts['category_customers'],
+        'top_n': top_n,
+        'subcategory_customers': parts['subcategory_customers'],
+    })
+
+
+def _fig1(charts):
     fig1 = px.pie(
-        category_customers, 
+        charts['category_customers'], 
         names='category', 
         values='customer_base', 
         title='CATEGORY WISE CUSTOMER BASE',
@@ -88,14 +86,12 @@ def render():
         texttemplate='%{value:,}<br>%{percent}',
         automargin=True
     )
-    c1.plotly_chart(fig1, width="stretch")
+    return fig1
+
 
-    top15=round(customer_wise_sales.head(15)['sales'].sum()/filtered['selling_price'].sum()*100, 2)
-    top50=round(customer_wise_sales.head(50)['sales'].sum()/filtered['selling_price'].sum()*100, 2)
-    top100=round(customer_wise_sales.head(100)['sales'].sum()/filtered['selling_price'].sum()*100, 2)
-    top_n=pd.DataFrame({'Top N': ['Top 15', 'Top 50', 'Top 100'], 'Sales Share':[top15, top50, top100]})
+def _fig2(charts):
     fig2 = px.pie(
-        top_n, 
+        charts['top_n'], 
         names='Top N', 
         values='Sales Share', 
         title='TOP N CUSTOMERS SALES SHARE',
@@ -110,14 +106,12 @@ def render():
         automargin=True,
         texttemplate='%{value:.1f}%'
     )
-    c2.plotly_chart(fig2, width="stretch")
+    return fig2
 
-    c3, c4= st.columns(2)
 
-    subcategory_customers=filtered.groupby(by=
-                    'sub_category1').agg(customer_base=('user_id','nunique')).sort_values(by='customer_base').reset_index().tail(5)
+def _fig3(charts):
     fig3= px.bar(
-        subcategory_customers,
+        charts['subcategory_customers'],
         x='customer_base',
         y='sub_category1',
         orientation='h', 
@@ -132,10 +126,12 @@ def render():
         xaxis_title="Customer Base",
         yaxis_title="Subcategory"
     )
-    c3.plotly_chart(fig3, width="stretch")
+    return fig3
+
 
+def _fig4(charts):
     fig4= px.bar(
-        customer_orders.head(5),
+        charts['loyal_customers'],
         x='order_count',
         y='user_id',
         orientation='h', 
@@ -150,4 +146,68 @@ def render():
         xaxis_title="Order Count",
         yaxis_title="Customer"
     )
-    c4.plotly_chart(fig4, width="stretch")
\ No newline at end of file
+    return fig4
+
+
+# Chart builders, in layout order
+FIGURES = {
+    'fig1': _fig1,
+    'fig2': _fig2,
+    'fig3': _fig3,
+    'fig4': _fig4,
+}
+
+
+def render():
+    st.set_page_config(layout="wide")
+    st.title("CUSTOMER DASHBOARD OF AMAZON")
+
+    lap = stopwatch()
+    filters = sidebar_filters()
+    lap('filters')
+
+    version = data.data_version()
+    result = data.cached_view('customer', filters, lambda: compute(data, filters), version)
+    lap('compute')
+    kpis = result.kpis
+    charts = result.charts
+
+    # KPIs
+    col1, col2, col3, col4 = st.columns(4)
+    col5, col6, col7, col8 =st.columns(4)
+    with col1:
+        st.metric("Unique Customers", *distinct_metric(kpis, 'unique_customers'))
+    with col2:
+        st.metric("Repeated Customers", f"{kpis['repeat_customers']:,}")
+    with col3:
+        st.metric("Repeat Purchase Rate", f"{kpis['repeat_customers']/kpis['unique_customers']*100:.2f}%",
+                  help=distinct_metric(kpis, 'unique_customers')[1])
+    with col4:
+        st.metric("Repeat Customer Revenue", f"₹{kpis['repeat_revenue']/1000000:.2f}M")
+    with col5:
+        st.metric("Repeat Customer Revenue %", f"{kpis['repeat_revenue']/kpis['total_sales']*100:.2f}%")
+    with col6:
+        st.metric("Top 5 Customers Share share", f"{kpis['top5']}%")
+    
+    with col7:
+        st.metric("Maximum Ordered Amount", f"₹{kpis['max_ordered_amount']/1000:.2f}K")
+
+    lap('kpis')
+
+    # Charts, served from the figure cache or built together, then placed in layout order
+    figures = figure_specs('customer', filters, version, FIGURES, charts, result.figures)
+    lap('figures')
+    c1, c2 = st.columns(2)
+    plotly_chart(c1, figures['fig1'], width="stretch")
+    lap('fig1 render')
+
+    plotly_chart(c2, figures['fig2'], width="stretch")
+    lap('fig2 render')
+
+    c3, c4= st.columns(2)
+
+    plotly_chart(c3, figures['fig3'], width="stretch")
+    lap('fig3 render')
+
+    plotly_chart(c4, figures['fig4'], width="stretch")
+    lap('fig4 render')
\ No newline at end of file
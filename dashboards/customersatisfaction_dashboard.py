@@ -1,73 +1,100 @@
-import numpy as np
-import pandas as pd
+from functools import partial
+
 import streamlit as st
-import plotly.express as px
-import statsmodels
+import parallel
+import progressive
+from charts import figure_specs, plotly_chart, scatter
 import plotly.graph_objects as go
-from db import get_engine
+import data
+from dashboards.base import DashboardResult
+from dashboards.filters import sidebar_filters
+from profiling import stopwatch
 
-def render():
-    engine=get_engine()
-    amazon_orders = pd.read_sql("SELECT * FROM CleanedAmazonData", engine)
-  
-    st.set_page_config(layout="wide")
-    st.title("AMAZON CUSTOMER SATISFACTION ANALYSIS")
+# Columns this page reads from CleanedAmazonData, with compact dtypes
+COLUMNS = {
+    'product_id': 'category',
+    'category': 'category',
+    'sub_category1': 'category',
+    'discount_percentage': 'float32',
+    'selling_price': 'float32',
+    'rating': 'float32',
+    'rating_count': 'Int32',
+}
 
-    st.sidebar.header("Filters")
+def _products(filtered):
+    prod=filtered.groupby(by='product_id', observed=True).agg(avg_price=('selling_price', 'mean'), avg_discount=('discount_percentage', 'mean'),
+                                           avg_rating=('rating', 'mean'), avg_ratingcount=('rating_count', 'mean'),
+                                           order_count=('product_id','count'), sales=('selling_price', 'sum')).reset_index()
+    prod['avg_discount']=prod['avg_discount']*100
+    return prod
 
-    # Category filter 
-    categories = amazon_orders['category'].unique().tolist()
-    categories.sort()
-    category_selected = st.sidebar.multiselect(
-        "Select Category",
-        options=categories,
-        default=categories  
-    )
 
-    # Subcategory filter depends on selected category
-    subcategories = amazon_orders[amazon_orders['category'].isin(category_selected)]['sub_category1'].unique().tolist()
-    subcategories.sort()
-    subcategory_selected = st.sidebar.multiselect(
-        "Select Subcategory",
-        options=subcategories,
-        default=subcategories  
-    )
+def _category_rating(category_totals):
+    category_rating=category_totals.rename(columns={'rating_mean':
+                                                        'avg_rating'})[['category', 'avg_rating']].sort_values(by=
+                                                                                    'avg_rating', ascending=False)
+    category_rating['avg_rating']=category_rating['avg_rating'].round(2)
+    return category_rating
 
-    # Apply filters
-    if category_selected: 
-        filtered = amazon_orders[(amazon_orders['category'].isin(category_selected)) & 
-                                (amazon_orders['sub_category1'].isin(subcategory_selected))]
-    else:
-        filtered = amazon_orders.copy()
 
-    # KPIs
-    col1, col2, col3, col4= st.columns(4)
-    with col1:
-        st.metric("Average Rating", f"{filtered['rating'].mean():,.2f}")
+def _rating_orders(filtered):
+    rating_orders=filtered.groupby(by='rating').agg(order_count=('rating','count')).reset_index()
+    return rating_orders.dropna(subset='rating')
 
-    prod=filtered.groupby(by='product_id').agg(avg_price=('selling_price', 'mean'), avg_discount=('discount_percentage', 'mean'),
-                                           avg_rating=('rating', 'mean'), avg_ratingcount=('rating_count', 'mean'),
-                                           order_count=('product_id','count'), sales=('selling_price', 'sum')).reset_index()
-    prod['avg_discount']=prod['avg_discount']*100
-    share_of_products_with_average_rating_greater_than_or_equal_to_4=round(prod.loc[prod['avg_rating']>=4,
-                                                                       'avg_rating'].count()/prod['avg_rating'].count()*100, 2)
-    with col2:
-        st.metric("Share of Products >= 4", f"{share_of_products_with_average_rating_greater_than_or_equal_to_4}%")
 
-    avg_rating1 = filtered.groupby('category', as_index=False)['rating'].mean()
-    highest_rating1 = avg_rating1.loc[avg_rating1['rating'].idxmax()]
-    with col3:
-        st.metric("High Rating Category", highest_rating1['category'])
+def compute(data, filters):
+    # Everything the page shows for one selection, without Streamlit
+    step = stopwatch()
+    categories, subcategories = filters.categories, filters.subcategories
+    filtered = data.filtered_orders(categories, subcategories, COLUMNS)
+    step('fetch')
 
-    avg_rating2 = filtered.groupby('sub_category1', as_index=False)['rating'].mean()
-    highest_rating2 = avg_rating2.loc[avg_rating2['rating'].idxmax()]
-    with col4:
-        st.metric("High Rating Sub Category1", highest_rating2['sub_category1'])
+    # Independent of each other, so they can run side by side
+    parts = parallel.run_all({
+        'summary': lambda: data.summary(filtered, categories, subcategories),
+        'prod': lambda: _products(filtered),
+        'high_rating_category': lambda: data.top_n(filtered, 'category', 'rating', categories, subcategories,
+                                                   agg='mean')['category'].iloc[0],
+        'high_rating_subcategory1': lambda: data.top_n(filtered, 'sub_category1', 'rating', categories, subcategories,
+                                                       agg='mean')['sub_category1'].iloc[0],
+        'category_rating': lambda: _category_rating(data.breakdown('category', categories, subcategories)),
+        'rating_orders': lambda: _rating_orders(filtered),
+    })
+    kpis = parts['summary']
+    prod = parts['prod']
+    kpis['share_of_products_with_average_rating_greater_than_or_equal_to_4']=round(prod.loc[prod['avg_rating']>=4,
+                                                                       'avg_rating'].count()/prod['avg_rating'].count()*100, 2)
+    kpis['high_rating_category'] = parts['high_rating_category']
+    kpis['high_rating_subcategory1'] = parts['high_rating_subcategory1']
 
-    # Charts
-    c1, c2= st.columns(2)
     max_rating = prod['avg_rating'].max()
     top_rated = prod[prod['avg_rating'] == max_rating]
+
+    prod_clean = prod.dropna(subset=['avg_rating'])
+
+    step('ratings')
+    return DashboardResult(kpis=kpis, charts={
+        'top_rated': top_rated,
+        'category_rating': parts['category_rating'],
+        'prod_clean': prod_clean,
+        'rating_orders': parts['rating_orders'],
+    })
+
+
+def compute_quick(data, filters):
+    # The KPIs and the category ratings the aggregate cube answers on its own, for the progressive mode
+    categories, subcategories = filters.categories, filters.subcategories
+    kpis = dict(data.cube_summary(categories, subcategories))
+    kpis['high_rating_category'] = data.top_n(None, 'category', 'rating', categories, subcategories,
+                                              agg='mean')['category'].iloc[0]
+    kpis['high_rating_subcategory1'] = data.top_n(None, 'sub_category1', 'rating', categories, subcategories,
+                                                  agg='mean')['sub_category1'].iloc[0]
+    return DashboardResult(kpis=kpis, charts={
+        'category_rating': _category_rating(data.breakdown('category', categories, subcategories)),
+    })
+
+
+def _fig1(charts):
     fig1= go.Figure(data=[go.Table(
         header=dict(
             values=['Product ID', 'Rating'],
@@ -77,8 +104,8 @@ def render():
         ),
         cells=dict(
             values=[
-                top_rated['product_id'],
-                top_rated['avg_rating']
+                charts['top_rated']['product_id'],
+                charts['top_rated']['avg_rating']
             ],
             fill_color='lavender',
             align='center',
@@ -97,12 +124,10 @@ def render():
         },
         margin=dict(t=60, b=20),  
     )
+    return fig1
 
-    c1.plotly_chart(fig1, width="stretch")
 
-    category_rating=filtered.groupby(by='category').agg(avg_rating=('rating', 'mean')).sort_values(by=
-                                                                                    'avg_rating', ascending=False).reset_index()
-    category_rating['avg_rating']=category_rating['avg_rating'].round(2)
+def _fig2(charts):
     fig2= go.Figure(data=[go.Table(
         header=dict(
             values=['Category', 'Rating'],
@@ -112,8 +137,8 @@ def render():
         ),
         cells=dict(
             values=[
-                category_rating['category'],
-                category_rating['avg_rating']
+                charts['category_rating']['category'],
+                charts['category_rating']['avg_rating']
             ],
             align='center',
             font=dict(size=13),
@@ -132,22 +157,19 @@ def render():
         },
         margin=dict(t=60, b=20)
     )
+    return fig2
 
-    c2.plotly_chart(fig2, width="stretch")
-
-    c3, c4= st.columns(2)
 
-    prod_clean = prod.dropna(subset=['avg_rating'])
-    fig3 = px.scatter(
-        prod_clean,
+def _fig3(charts):
+    fig3 = scatter(
+        charts['prod_clean'],
         x='avg_price',
         y='avg_rating',
         title='PRICE VS RATING',
         size='avg_rating',
         hover_data=['avg_price', 'avg_rating'],
         color='avg_rating',
-        color_continuous_scale='Viridis',
-        trendline='ols'
+        color_continuous_scale='Viridis'
     )
 
     fig3.update_layout(
@@ -155,19 +177,19 @@ def render():
         yaxis_title='Rating',
         title_font=dict(size=18),
     )
+    return fig3
 
-    c3.plotly_chart(fig3, width="stretch")
 
-    fig4 = px.scatter(
-        prod_clean,
+def _fig4(charts):
+    fig4 = scatter(
+        charts['prod_clean'],
         x='avg_discount',
         y='avg_rating',
         title='DISCOUNT VS RATING',
         size='avg_rating',
         hover_data=['avg_discount', 'avg_rating'],
         color='avg_rating',
-        color_continuous_scale='Cividis',
-        trendline='ols'
+        color_continuous_scale='Cividis'
     )
 
     fig4.update_layout(
@@ -175,20 +197,19 @@ def render():
         yaxis_title='Rating',
         title_font=dict(size=18),
     )
+    return fig4
 
-    c4.plotly_chart(fig4, width="stretch")
 
-    c5, c6= st.columns(2)
-    fig5 = px.scatter(
-        prod_clean,
+def _fig5(charts):
+    fig5 = scatter(
+        charts['prod_clean'],
         x='avg_ratingcount',
         y='avg_rating',
         title='RATING COUNT VS RATING',
         size='avg_rating',
         hover_data=['avg_ratingcount', 'avg_rating'],
         color='avg_rating',
-        color_continuous_scale='blues',
-        trendline='ols'
+        color_continuous_scale='blues'
     )
 
     fig5.update_layout(
@@ -196,21 +217,19 @@ def render():
         yaxis_title='Rating',
         title_font=dict(size=18),
     )
+    return fig5
 
-    c5.plotly_chart(fig5, width="stretch")
 
-    rating_orders=filtered.groupby(by='rating').agg(order_count=('rating','count')).reset_index()
-    rating_orders=rating_orders.dropna(subset='rating')
-    fig6 = px.scatter(
-        rating_orders,
+def _fig6(charts):
+    fig6 = scatter(
+        charts['rating_orders'],
         x='rating',
         y='order_count',
         title='RATING VS NUMBER OF ORDERS',
         size='rating',
         hover_data=['rating', 'order_count'],
         color='rating',
-        color_continuous_scale='plasma',
-        trendline='ols'
+        color_continuous_scale='plasma'
     )
 
     fig6.update_layout(
@@ -218,5 +237,69 @@ def render():
         yaxis_title='Number of Orders',
         title_font=dict(size=18),
     )
+    return fig6
+
+
+# Chart builders, in layout order
+FIGURES = {
+    'fig1': _fig1,
+    'fig2': _fig2,
+    'fig3': _fig3,
+    'fig4': _fig4,
+    'fig5': _fig5,
+    'fig6': _fig6,
+}
+
+
+# Label, KPI and formatting of each metric, in layout order
+KPIS = [
+    ("Average Rating", 'avg_rating', lambda value: f"{value:,.2f}"),
+    ("Share of Products >= 4", 'share_of_products_with_average_rating_greater_than_or_equal_to_4',
+     lambda value: f"{value}%"),
+    ("High Rating Category", 'high_rating_category', str),
+    ("High Rating Sub Category1", 'high_rating_subcategory1', str),
+]
+
+
+def _show_kpis(slots, kpis):
+    # KPIs without a value yet are shown as pending
+    for slot, (label, name, format) in zip(slots, KPIS):
+        slot.metric(label, format(kpis[name]) if name in kpis else "…")
+
+
+def render():
+    st.set_page_config(layout="wide")
+    st.title("AMAZON CUSTOMER SATISFACTION ANALYSIS")
+
+    lap = stopwatch()
+    filters = sidebar_filters()
+    lap('filters')
+
+    version = data.data_version()
+    # KPIs
+    col1, col2, col3, col4= st.columns(4)
+    kpi_slots = [column.empty() for column in (col1, col2, col3, col4)]
+    c1, c2= st.columns(2)
+    c3, c4= st.columns(2)
+    c5, c6= st.columns(2)
+    slots = {f'fig{i}': column.empty() for i, column in enumerate((c1, c2, c3, c4, c5, c6), 1)}
+
+    if progressive.ENABLED:
+        # Cube KPIs and the category ratings first, then each chart as it is ready, with sampled
+        # stand-ins past the time budget
+        # The top rated products are a ranking, which a product sample cannot approximate
+        progressive.fill('customersatisfaction', filters, version, compute, compute_quick, FIGURES, ['fig2'],
+                         partial(_show_kpis, kpi_slots), slots, exact_only=['fig1'])
+        return
+
+    result = data.cached_view('customersatisfaction', filters, lambda: compute(data, filters), version)
+    lap('compute')
+    _show_kpis(kpi_slots, result.kpis)
+    lap('kpis')
 
-    c6.plotly_chart(fig6, width="stretch")
\ No newline at end of file
+    # Charts, served from the figure cache or built together, then placed in layout order
+    figures = figure_specs('customersatisfaction', filters, version, FIGURES, result.charts, result.figures)
+    lap('figures')
+    for name, slot in slots.items():
+        plotly_chart(slot, figures[name], width="stretch")
+        lap(f'{name} render')
@@ -0,0 +1,30 @@
+import streamlit as st
+from data import filter_options
+from dashboards.base import Filters
+
+
+def subcategories_under(options, categories):
+    # Every sub_category1 of the selected categories, sorted, as the subcategory filter offers them
+    return sorted({subcategory for category in categories for subcategory in options[category]})
+
+
+def sidebar_filters():
+    st.sidebar.header("Filters")
+    options = filter_options()
+
+    # Category filter with "All"
+    categories = list(options)
+    category_selected = st.sidebar.multiselect(
+        "Select Category",
+        options=categories,
+        default=categories
+    )
+
+    # Subcategory filter depends on selected category
+    subcategories = subcategories_under(options, category_selected)
+    subcategory_selected = st.sidebar.multiselect(
+        "Select Subcategory",
+        options=subcategories,
+        default=subcategories
+    )
+    return Filters.of(category_selected, subcategory_selected)
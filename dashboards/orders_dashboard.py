@@ -1,72 +1,72 @@
-import numpy as np
-import pandas as pd
 import streamlit as st
 import plotly.express as px
-import statsmodels
-from db import get_engine
-
-
-def render():
-    engine=get_engine()
-    amazon_orders = pd.read_sql("SELECT * FROM CleanedAmazonData", engine)
-    st.set_page_config(layout="wide")
-    st.title("AMAZON ORDERS INSIGHTS")
-    
-    st.sidebar.header("Filters")
-
-    # Category filter with "All"
-    categories = amazon_orders['category'].unique().tolist()
-    categories.sort()
-    category_selected = st.sidebar.multiselect(
-        "Select Category",
-        options=categories,
-        default=categories  
-    )
-
-    # Subcategory filter depends on selected category
-    subcategories = amazon_orders[amazon_orders['category'].isin(category_selected)]['sub_category1'].unique().tolist()
-    subcategories.sort()
-    subcategory_selected = st.sidebar.multiselect(
-        "Select Subcategory",
-        options=subcategories,
-        default=subcategories  
-    )
+import parallel
+from charts import figure_specs, plotly_chart, scatter
+import data
+from dashboards.base import DashboardResult, distinct_metric
+from dashboards.filters import sidebar_filters
+from profiling import stopwatch
+
+# Columns this page reads from CleanedAmazonData, with compact dtypes
+COLUMNS = {
+    'product_id': 'category',
+    'category': 'category',
+    'sub_category1': 'category',
+    'discount_percentage': 'float32',
+    'selling_price': 'float32',
+}
+
+
+def _category_orders(category_totals):
+    category_orders = category_totals[['category', 'orders']].sort_values(by='orders', ascending=False)
+    category_orders.columns = ['category', 'order_count']
+    return category_orders
 
-    # Apply filters
-    if category_selected: 
-        filtered = amazon_orders[(amazon_orders['category'].isin(category_selected)) & 
-                                (amazon_orders['sub_category1'].isin(subcategory_selected))]
-    else:
-        filtered = amazon_orders.copy()
 
-    # KPIs
-    col1, col2, col3, col4 = st.columns(4)
-    col5, col6, col7, col8 = st.columns(4)
-    with col1:
-        st.metric("📦 Unique Products", f"{filtered['product_id'].nunique():,}")
-    with col2:
-        st.metric("🛒 Total Orders", f"{filtered['product_id'].count():,}")
-    with col3:
-        st.metric("💸 Average Discount", f"{filtered['discount_percentage'].mean()*100:.2f}%")
-    with col4:
-        st.metric("💰 Average Selling Price", f"₹{filtered['selling_price'].mean():,.0f}")
-    with col5:
-        st.metric("📂 Unique Categories", filtered['category'].nunique())
-    with col6:
-        st.metric("🗂️ Unique Subcategories", filtered['sub_category1'].nunique())
+def _highest_price_product(filtered):
+    price = (filtered.groupby(['category', 'product_id'], as_index=False, observed=True)['selling_price'].mean())
+    highest_price_product = price.loc[price.groupby('category', observed=True)['selling_price'].idxmax()]
+    return highest_price_product.sort_values(by='selling_price', ascending=False)
 
-    max_price_row = filtered.loc[filtered['selling_price'].idxmax()]
-    with col7:
-        st.metric("🏆 Highest Price Product", f"{max_price_row['product_id']}")
 
-    # Charts
-    c1, c2=st.columns(2)
+def _top_subcategories(subcategory_totals):
+    top_subcategories = subcategory_totals[['sub_category1', 'orders']].nlargest(5, 'orders')
+    top_subcategories.columns = ['subcategory', 'order_count']
+    return top_subcategories
 
-    category_orders = filtered['category'].value_counts().reset_index()
-    category_orders.columns = ['category', 'order_count']
 
+def _discount_orders(filtered):
+    discount_orders = (filtered.groupby('discount_percentage')['product_id'].count().reset_index())
+    discount_orders['discount_percentage']=discount_orders['discount_percentage']*100
+    discount_orders.columns = ['discount', 'order_count']
+    return discount_orders
+
+
+def compute(data, filters):
+    # Everything the page shows for one selection, without Streamlit
+    step = stopwatch()
+    categories, subcategories = filters.categories, filters.subcategories
+    filtered = data.filtered_orders(categories, subcategories, COLUMNS)
+    step('fetch')
+
+    # Independent of each other, so they can run side by side
+    parts = parallel.run_all({
+        'summary': lambda: data.summary(filtered, categories, subcategories),
+        'max_price_product': lambda: data.top_n(filtered, 'product_id', 'selling_price', categories, subcategories,
+                                                agg='max')['product_id'].iloc[0],
+        'category_orders': lambda: _category_orders(data.breakdown('category', categories, subcategories)),
+        'highest_price_product': lambda: _highest_price_product(filtered),
+        'top_subcategories': lambda: _top_subcategories(data.breakdown('sub_category1', categories, subcategories)),
+        'discount_orders': lambda: _discount_orders(filtered),
+    })
+    kpis = parts.pop('summary')
+    kpis['max_price_product'] = parts.pop('max_price_product')
+    return DashboardResult(kpis=kpis, charts=parts)
+
+
+def _fig1(charts):
     fig1 = px.pie(
-        category_orders, 
+        charts['category_orders'], 
         names='category', 
         values='order_count', 
         title='CATEGORY WISE ORDER FREQUENCY',
@@ -80,15 +80,12 @@ def render():
         automargin=True,
         texttemplate='%{value:,}<br>%{percent}'
     )
-    c1.plotly_chart(fig1, width="stretch")
-
-
-    price = (filtered.groupby(['category', 'product_id'], as_index=False)['selling_price'].mean())
+    return fig1
 
-    highest_price_product = price.loc[price.groupby('category')['selling_price'].idxmax()]
 
+def _fig2(charts):
     fig2 = px.bar(
-        highest_price_product.sort_values(by='selling_price', ascending=False),
+        charts['highest_price_product'],
         x='category',
         y='selling_price',
         text='product_id',
@@ -99,16 +96,12 @@ def render():
 
     fig2.update_traces(textposition='outside')
     fig2.update_layout(xaxis_title='Category', yaxis_title='Selling Price')
+    return fig2
 
-    c2.plotly_chart(fig2, width="stretch")
-
-    c3, c4=st.columns(2)
-
-    top_subcategories = (filtered['sub_category1'].value_counts().head(5).reset_index())
-    top_subcategories.columns = ['subcategory', 'order_count']
 
+def _fig3(charts):
     fig3 = px.bar(
-        top_subcategories,
+        charts['top_subcategories'],
         y='subcategory',
         x='order_count',
         orientation='h',
@@ -120,29 +113,87 @@ def render():
 
     fig3.update_traces(textposition='inside')
     fig3.update_layout(yaxis=dict(categoryorder='total ascending'), xaxis_title='Subcategory', yaxis_title='Order Count')
+    return fig3
 
-    c3.plotly_chart(fig3, width="stretch")
 
-    discount_orders = (filtered.groupby('discount_percentage')['product_id'].count().reset_index())
-    discount_orders['discount_percentage']=discount_orders['discount_percentage']*100
-    discount_orders.columns = ['discount', 'order_count']
-
-    fig4 = px.scatter(
-        discount_orders,
+def _fig4(charts):
+    fig4 = scatter(
+        charts['discount_orders'],
         x='discount',
         y='order_count',
         title='DISCOUNT vs NUMBER OF ORDERS',
         size='order_count',
         hover_data=['discount', 'order_count'],
         color='order_count',
-        color_continuous_scale='Cividis',
-        trendline='ols'
+        color_continuous_scale='Cividis'
     )
 
     fig4.update_layout(
         xaxis_title='Discount (%)',
         yaxis_title='Number of Orders'
     )
+    return fig4
+
+
+# Chart builders, in layout order
+FIGURES = {
+    'fig1': _fig1,
+    'fig2': _fig2,
+    'fig3': _fig3,
+    'fig4': _fig4,
+}
+
+
+def render():
+    st.set_page_config(layout="wide")
+    st.title("AMAZON ORDERS INSIGHTS")
+    
+    lap = stopwatch()
+    filters = sidebar_filters()
+    lap('filters')
+
+    version = data.data_version()
+    result = data.cached_view('orders', filters, lambda: compute(data, filters), version)
+    lap('compute')
+    kpis = result.kpis
+    charts = result.charts
+
+    # KPIs
+    col1, col2, col3, col4 = st.columns(4)
+    col5, col6, col7, col8 = st.columns(4)
+    with col1:
+        st.metric("📦 Unique Products", *distinct_metric(kpis, 'unique_products'))
+    with col2:
+        st.metric("🛒 Total Orders", f"{kpis['orders']:,}")
+    with col3:
+        st.metric("💸 Average Discount", f"{kpis['avg_discount']*100:.2f}%")
+    with col4:
+        st.metric("💰 Average Selling Price", f"₹{kpis['avg_price']:,.0f}")
+    with col5:
+        st.metric("📂 Unique Categories", kpis['unique_categories'])
+    with col6:
+        st.metric("🗂️ Unique Subcategories", kpis['unique_subcategories'])
+    with col7:
+        st.metric("🏆 Highest Price Product", f"{kpis['max_price_product']}")
+
+    lap('kpis')
+
+    # Charts, served from the figure cache or built together, then placed in layout order
+    figures = figure_specs('orders', filters, version, FIGURES, charts, result.figures)
+    lap('figures')
+    c1, c2=st.columns(2)
+
+    plotly_chart(c1, figures['fig1'], width="stretch")
+    lap('fig1 render')
+
+    plotly_chart(c2, figures['fig2'], width="stretch")
+    lap('fig2 render')
+
+    c3, c4=st.columns(2)
+
+    plotly_chart(c3, figures['fig3'], width="stretch")
+    lap('fig3 render')
 
-    c4.plotly_chart(fig4, width="stretch")
+    plotly_chart(c4, figures['fig4'], width="stretch")
+    lap('fig4 render')
 
@@ -1,82 +1,100 @@
-import numpy as np
+from functools import partial
+
 import pandas as pd
 import streamlit as st
 import plotly.express as px
-import statsmodels
-from db import get_engine
+import parallel
+import progressive
+from charts import figure_specs, plotly_chart, scatter
+from aggregation import AggregationEngine
+from concentration import concentration
+import data
+from dashboards.base import DashboardResult
+from dashboards.filters import sidebar_filters
+from profiling import stopwatch
 
-def render():
-    engine=get_engine()
-    amazon_orders = pd.read_sql("SELECT * FROM CleanedAmazonData", engine)
-  
-    st.set_page_config(layout="wide")
-    st.title("PRODUCT SALES ANALYSIS AND PERFORAMNCE METRICS")
+# Columns this page reads from CleanedAmazonData, with compact dtypes
+COLUMNS = {
+    'product_id': 'category',
+    'category': 'category',
+    'sub_category1': 'category',
+    'sub_category2': 'category',
+    'sub_category3': 'category',
+    'discount_percentage': 'float32',
+    'selling_price': 'float32',
+    'rating': 'float32',
+}
 
-    st.sidebar.header("Filters")
+# Every groupby on this page, computed together over shared group codes
+AGGREGATIONS = {
+    'product': (['product_id'], {
+        'avg_price': ('selling_price', 'mean'),
+        'avg_discount': ('discount_percentage', 'mean'),
+        'avg_rating': ('rating', 'mean'),
+        'sales': ('selling_price', 'sum'),
+    }),
+    'category_product': (['category', 'product_id'], {'sale_amount': ('selling_price', 'sum')}),
+    'sub_category2': (['sub_category2'], {'sales': ('selling_price', 'sum')}),
+    'sub_category3': (['sub_category3'], {'sales': ('selling_price', 'sum')}),
+}
 
-    # Category filter 
-    categories = amazon_orders['category'].unique().tolist()
-    categories.sort()
-    category_selected = st.sidebar.multiselect(
-        "Select Category",
-        options=categories,
-        default=categories  
-    )
+def _top_seller(data, filtered, level, filters):
+    return data.top_n(filtered, level, 'selling_price', filters.categories, filters.subcategories)[level].iloc[0]
 
-    # Subcategory filter depends on selected category
-    subcategories = amazon_orders[amazon_orders['category'].isin(category_selected)]['sub_category1'].unique().tolist()
-    subcategories.sort()
-    subcategory_selected = st.sidebar.multiselect(
-        "Select Subcategory",
-        options=subcategories,
-        default=subcategories  
-    )
 
-    # Apply filters
-    if category_selected: 
-        filtered = amazon_orders[(amazon_orders['category'].isin(category_selected)) & 
-                                (amazon_orders['sub_category1'].isin(subcategory_selected))]
-    else:
-        filtered = amazon_orders.copy()
+def compute(data, filters):
+    # Everything the page shows for one selection, without Streamlit
+    step = stopwatch()
+    categories, subcategories = filters.categories, filters.subcategories
+    filtered = data.filtered_orders(categories, subcategories, COLUMNS)
+    step('fetch')
 
-    # KPIs
-    col1, col2, col3, col4= st.columns(4)
-    col5, col6, col7, col8 = st.columns(4)
-    with col1:
-        st.metric("Total Sales", f"₹{filtered['selling_price'].sum()/1000000:,.2f}M")
-    with col2:
-        st.metric("Average Order Value", f"₹{filtered['selling_price'].mean():,.2f}")
-
-    top_product = filtered.groupby('product_id')['selling_price'].sum().idxmax()
-    with col3:
-        st.metric("Top Selling Product",top_product)
-
-    product_sales=filtered.groupby(by='product_id').agg(sales=('selling_price', 'sum')).sort_values(by='sales',
-                                                                                            ascending=False).reset_index()
-    top_5=round(product_sales.head(5)['sales'].sum()/filtered['selling_price'].sum()*100, 2)
-    with col4:
-        st.metric("Top 5 Products Sale Share", f"{top_5}%")
-
-    top_category = filtered.groupby('category')['selling_price'].sum().idxmax()
-    with col5:
-        st.metric("Top Selling Category", top_category)
-
-    top_subcategory1 = filtered.groupby('sub_category1')['selling_price'].sum().idxmax()
-    with col6:
-        st.metric("Top Selling Sub Category1", top_subcategory1)
-
-    top_subcategory2 = filtered.groupby('sub_category2')['selling_price'].sum().idxmax()
-    with col7:
-        st.metric("Top Selling Sub Category2", top_subcategory2)
-
-    top_subcategory3 = filtered.groupby('sub_category3')['selling_price'].sum().idxmax()
-    with col8:
-        st.metric("Top Selling Sub Category3", top_subcategory3)
-
-    # Charts
-    c1, c2, c3= st.columns(3)
+    # Category levels come from the pre-aggregated cube, the rest from the engine, which shares
+    # its groupings between aggregations and so runs as one task
+    tasks = {
+        'summary': lambda: data.summary(filtered, categories, subcategories),
+        'aggregates': lambda: AggregationEngine(filtered).run(AGGREGATIONS),
+    }
+    for level in ['category', 'sub_category1']:
+        tasks[f'top_{level}'] = partial(_top_seller, data, filtered, level, filters)
+    parts = parallel.run_all(tasks)
+    kpis = parts.pop('summary')
+    aggregates = parts.pop('aggregates')
+    kpis.update(parts)
+    for level in ['product', 'sub_category2', 'sub_category3']:
+        totals = aggregates[level]
+        kpis[f'top_{totals.columns[0]}'] = totals.iloc[totals['sales'].idxmax(), 0]
+
+    prod=aggregates['product']
+    shares=concentration(prod['sales'], top=(5, 20, 50, 100), total=kpis['total_sales'])['top_shares']
+    kpis['top_5']=round(shares[5]*100, 2)
+    top_N=pd.DataFrame({'Top_N': ['Top 20', 'Top 50', 'Top 100'], 'Sales_Share':[round(shares[n]*100, 2) for n in (20, 50, 100)]})
+
+    sale_amount = aggregates['category_product']
+    highest_sale_product = sale_amount.loc[sale_amount.groupby('category', observed=True)['sale_amount'].idxmax()]
+
+    prod['avg_discount']=prod['avg_discount']*100
+
+    step('aggregations')
+    return DashboardResult(kpis=kpis, charts={
+        'top_products': prod[['product_id', 'sales']].nlargest(5, 'sales'),
+        'top_N': top_N,
+        'highest_sale_product': highest_sale_product.sort_values(by='sale_amount', ascending=False),
+        'prod': prod,
+    })
+
+
+def compute_quick(data, filters):
+    # The KPIs the aggregate cube answers on its own, for the progressive mode
+    kpis = dict(data.cube_summary(filters.categories, filters.subcategories))
+    for level in ['category', 'sub_category1']:
+        kpis[f'top_{level}'] = _top_seller(data, None, level, filters)
+    return DashboardResult(kpis=kpis)
+
+
+def _fig1(charts):
     fig1 = px.bar(
-        product_sales.head(5),
+        charts['top_products'],
         x='product_id',
         y='sales',
         title='TOP 5 PRODUCTS BY SALE AMOUNT',
@@ -87,15 +105,12 @@ def render():
 
     fig1.update_traces(textposition='outside')
     fig1.update_layout(xaxis_title='Product', yaxis_title='Sales')
+    return fig1
 
-    c1.plotly_chart(fig1, width="stretch")
 
-    top_20=round(product_sales.head(20)['sales'].sum()/filtered['selling_price'].sum()*100, 2)
-    top_50=round(product_sales.head(50)['sales'].sum()/filtered['selling_price'].sum()*100, 2)
-    top_100=round(product_sales.head(100)['sales'].sum()/filtered['selling_price'].sum()*100, 2)
-    top_N=pd.DataFrame({'Top_N': ['Top 20', 'Top 50', 'Top 100'], 'Sales_Share':[top_20, top_50, top_100]})
+def _fig2(charts):
     fig2 = px.pie(
-        top_N, 
+        charts['top_N'], 
         names='Top_N', 
         values='Sales_Share', 
         title='SALES SHARE BY TOP N PRODUCTS',
@@ -109,14 +124,12 @@ def render():
         automargin=True,
         texttemplate='%{value:.2f}%'
     )
-    c2.plotly_chart(fig2, width="stretch")
+    return fig2
 
-    sale_amount = (filtered.groupby(['category', 'product_id'], as_index=False).agg(sale_amount=('selling_price','sum')))
-
-    highest_sale_product = sale_amount.loc[sale_amount.groupby('category')['sale_amount'].idxmax()]
 
+def _fig3(charts):
     fig3 = px.bar(
-    highest_sale_product.sort_values(by='sale_amount', ascending=False),
+        charts['highest_sale_product'],
         x='category',
         y='sale_amount',
         text='product_id',
@@ -127,23 +140,19 @@ def render():
 
     fig3.update_traces(textposition='outside')
     fig3.update_layout(xaxis_title='Category', yaxis_title='Selling Price')
+    return fig3
 
-    c3.plotly_chart(fig3, width="stretch")
 
-    c4, c5, c6= st.columns(3)
-    prod=filtered.groupby(by='product_id').agg(avg_price=('selling_price', 'mean'), avg_discount=('discount_percentage', 'mean'),
-                                            avg_rating=('rating', 'mean'), sales=('selling_price', 'sum')).reset_index()
-    prod['avg_discount']=prod['avg_discount']*100
-    fig4 = px.scatter(
-        prod,
+def _fig4(charts):
+    fig4 = scatter(
+        charts['prod'],
         x='avg_price',
         y='sales',
         title='PRICE VS SALES',
         size='sales',
         hover_data=['avg_price', 'sales'],
         color='sales',
-        color_continuous_scale='Cividis',
-        trendline='ols'
+        color_continuous_scale='Cividis'
         )
 
     fig4.update_layout(
@@ -151,19 +160,19 @@ def render():
         yaxis_title='Sales',
         title_font=dict(size=18),
     )
+    return fig4
 
-    c4.plotly_chart(fig4, width="stretch")
 
-    fig5 = px.scatter(
-        prod,
+def _fig5(charts):
+    fig5 = scatter(
+        charts['prod'],
         x='avg_discount',
         y='sales',
         title='DISCOUNT VS SALES',
         size='sales',
         hover_data=['avg_discount', 'sales'],
         color='sales',
-        color_continuous_scale='Turbo',
-        trendline='ols'
+        color_continuous_scale='Turbo'
     )
 
     fig5.update_layout(
@@ -171,19 +180,19 @@ def render():
         yaxis_title='Sales',
         title_font=dict(size=18),
     )
+    return fig5
 
-    c5.plotly_chart(fig5, width="stretch")
 
-    fig6 = px.scatter(
-        prod,
+def _fig6(charts):
+    fig6 = scatter(
+        charts['prod'],
         x='avg_rating',
         y='sales',
         title='RATING VS SALES',
         size='sales',
         hover_data=['avg_rating', 'sales'],
         color='sales',
-        color_continuous_scale='plasma',
-        trendline='ols'
+        color_continuous_scale='plasma'
     )
 
     fig6.update_layout(
@@ -191,5 +200,72 @@ def render():
         yaxis_title='Sales',
         title_font=dict(size=18),
     )
+    return fig6
+
+
+# Chart builders, in layout order
+FIGURES = {
+    'fig1': _fig1,
+    'fig2': _fig2,
+    'fig3': _fig3,
+    'fig4': _fig4,
+    'fig5': _fig5,
+    'fig6': _fig6,
+}
+
+
+# Label, KPI and formatting of each metric, in layout order
+KPIS = [
+    ("Total Sales", 'total_sales', lambda value: f"₹{value/1000000:,.2f}M"),
+    ("Average Order Value", 'avg_price', lambda value: f"₹{value:,.2f}"),
+    ("Top Selling Product", 'top_product_id', str),
+    ("Top 5 Products Sale Share", 'top_5', lambda value: f"{value}%"),
+    ("Top Selling Category", 'top_category', str),
+    ("Top Selling Sub Category1", 'top_sub_category1', str),
+    ("Top Selling Sub Category2", 'top_sub_category2', str),
+    ("Top Selling Sub Category3", 'top_sub_category3', str),
+]
+
+
+def _show_kpis(slots, kpis):
+    # KPIs without a value yet are shown as pending
+    for slot, (label, name, format) in zip(slots, KPIS):
+        slot.metric(label, format(kpis[name]) if name in kpis else "…")
+
+
+def render():
+    st.set_page_config(layout="wide")
+    st.title("PRODUCT SALES ANALYSIS AND PERFORAMNCE METRICS")
+
+    lap = stopwatch()
+    filters = sidebar_filters()
+    lap('filters')
+
+    version = data.data_version()
+    # KPIs
+    col1, col2, col3, col4= st.columns(4)
+    col5, col6, col7, col8 = st.columns(4)
+    kpi_slots = [column.empty() for column in (col1, col2, col3, col4, col5, col6, col7, col8)]
+    c1, c2, c3= st.columns(3)
+    c4, c5, c6= st.columns(3)
+    slots = {f'fig{i}': column.empty() for i, column in enumerate((c1, c2, c3, c4, c5, c6), 1)}
+
+    if progressive.ENABLED:
+        # Cube KPIs first, then each chart as it is ready, with sampled stand-ins past the time budget
+        # Top products, their sales shares and each category's top product are rankings, which a
+        # product sample cannot approximate
+        progressive.fill('salesperformance', filters, version, compute, compute_quick, FIGURES, [],
+                         partial(_show_kpis, kpi_slots), slots, exact_only=['fig1', 'fig2', 'fig3'])
+        return
+
+    result = data.cached_view('salesperformance', filters, lambda: compute(data, filters), version)
+    lap('compute')
+    _show_kpis(kpi_slots, result.kpis)
+    lap('kpis')
 
-    c6.plotly_chart(fig6, width="stretch")
\ No newline at end of file
+    # Charts, served from the figure cache or built together, then placed in layout order
+    figures = figure_specs('salesperformance', filters, version, FIGURES, result.charts, result.figures)
+    lap('figures')
+    for name, slot in slots.items():
+        plotly_chart(slot, figures[name], width="stretch")
+        lap(f'{name} render')
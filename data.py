@@ -0,0 +1,376 @@
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+import cube
+import customers
+import filter_index
+import hll
+import ingest
+import precompute
+import queries
+import shared
+import snapshot
+from ingest import compact
+from profiling import stage
+from result_cache import ResultCache
+
+# Seconds a loaded copy of CleanedAmazonData is served before it is reloaded
+CACHE_TTL = float(os.getenv("amazon_cache_ttl", "600"))
+# Filter and aggregate in Azure SQL instead of on the in-memory copy
+PUSHDOWN = os.getenv("amazon_sql_pushdown", "false").lower() == "true"
+# Distinct customers and products estimated from the cube's HyperLogLog sketches instead of
+# counted on the rows (in-memory mode only)
+APPROX_DISTINCT = os.getenv("amazon_approx_distinct", "false").lower() == "true" and not PUSHDOWN
+# Upper bound for memoized per-selection dashboard results
+VIEW_CACHE_BYTES = int(float(os.getenv("amazon_view_cache_mb", "256")) * 1024 * 1024)
+# Upper bound for pushed-down query results, which include the filtered row sets
+PUSHDOWN_CACHE_BYTES = int(float(os.getenv("amazon_pushdown_cache_mb", "128")) * 1024 * 1024)
+
+# Seconds between background reloads (or snapshot checks) once the refresher is started
+REFRESH_INTERVAL = float(os.getenv("amazon_refresh_interval", str(CACHE_TTL)))
+
+logger = logging.getLogger(__name__)
+
+# One copy of the table per process, shared by every page and session
+_lock = threading.Lock()
+# Held while a new version is being read, so only one load runs at a time
+_load_lock = threading.Lock()
+_cache = {"frame": None, "columns": {}, "index": None, "cube": None, "customers": None, "source": None,
+          "token": None, "loaded_at": 0.0, "version": 0}
+_stats = {"hits": 0, "misses": 0, "last_load_seconds": 0.0, "last_refresh_error": None}
+_refresher = {"thread": None}
+# Set to reload ahead of the interval, e.g. when a session found the copy expired
+_wake = threading.Event()
+# KPI values and chart frames per (dashboard, selection, data version), shared across sessions
+views = ResultCache(VIEW_CACHE_BYTES)
+
+
+# The sidebar filters and the aggregate cube need these on every page
+BASE_COLUMNS = cube.COLUMNS
+
+# Cube totals behind each summary KPI
+CUBE_SUMMARY = {
+    "orders": 'orders',
+    "unique_categories": 'unique_categories',
+    "unique_subcategories": 'unique_subcategories',
+    "total_sales": 'selling_price_sum',
+    "avg_price": 'selling_price_mean',
+    "max_price": 'selling_price_max',
+    "avg_discount": 'discount_percentage_mean',
+    "avg_rating": 'rating_mean',
+}
+
+
+def _read(columns):
+    if snapshot.ENABLED:
+        return snapshot.read(columns)
+    return ingest.load(queries.stream_rows((), (), list(columns)), columns)
+
+
+def _load(columns):
+    # Builds the new version off to the side; sessions keep reading the current one until the swap
+    start = time.perf_counter()
+    if shared.ENABLED:
+        if shared.is_loader():
+            # Columns other processes asked for are loaded for everyone
+            columns = {**columns, **shared.requested_columns()}
+        else:
+            frame = _attach_shared(columns)
+            if frame is not None:
+                return frame
+    # Taken before the read, so a sync that lands during it is picked up next time
+    source = snapshot.modified() if snapshot.ENABLED else None
+    lineage = snapshot.lineage() if snapshot.ENABLED else None
+    with stage('load'):
+        frame = compact(_read(columns), columns)
+    if snapshot.ENABLED and source is None:
+        # The read itself created the snapshot
+        source = snapshot.modified()
+    index = filter_index.FilterIndex.build(frame)
+    aggregates = cube.AggregateCube.build(frame)
+    # Only the orders appended since the previous version are added when the snapshot just grew
+    customer_store = customers.update(_cache["customers"], frame, lineage)
+    state = {"frame": frame, "columns": columns, "index": index, "cube": aggregates, "customers": customer_store,
+             "source": source}
+    token = None
+    if shared.ENABLED and shared.is_loader():
+        # Published for the other processes, then served from the shared copy here as well
+        with stage('publish'):
+            token = shared.publish(state)
+            state = shared.attach(token)
+    _swap(state, token, start)
+    return state["frame"]
+
+
+def _attach_shared(columns):
+    # The loader's latest version when it has every column asked for; None to load a private copy
+    for _ in range(2):
+        token = shared.wait_for_version()
+        if token is None:
+            return None
+        if token == _cache["token"] and _fresh(columns):
+            with _lock:
+                _cache["loaded_at"] = time.monotonic()
+            return _cache["frame"]
+        start = time.perf_counter()
+        try:
+            with stage('attach'):
+                state = shared.attach(token)
+        except FileNotFoundError:
+            # Replaced and removed between reading the pointer and opening it
+            continue
+        if columns.keys() <= state["columns"].keys():
+            _swap(state, token, start)
+            return state["frame"]
+        shared.request_columns(columns)
+        return None
+    return None
+
+
+def _swap(state, token, start):
+    with _lock:
+        _stats["last_load_seconds"] = time.perf_counter() - start
+        _cache.update(state, token=token, loaded_at=time.monotonic(), version=_cache["version"] + 1)
+        views.clear()
+
+
+def _fresh(columns):
+    frame = _cache["frame"]
+    return frame is not None and columns.keys() <= _cache["columns"].keys()
+
+
+def load_orders(columns):
+    # The cached frame holds the union of the columns every page has asked for
+    with _lock:
+        if _fresh(columns):
+            expired = time.monotonic() - _cache["loaded_at"] >= CACHE_TTL
+            # With the refresher running, an expired copy is still served while it reloads
+            if not expired or _refresher_running():
+                _stats["hits"] += 1
+                if expired:
+                    _wake.set()
+                return _cache["frame"]
+    # Blocks only when nothing usable is loaded yet, or a page needs new columns
+    with _load_lock:
+        with _lock:
+            if _fresh(columns) and time.monotonic() - _cache["loaded_at"] < CACHE_TTL:
+                _stats["hits"] += 1
+                return _cache["frame"]
+            _stats["misses"] += 1
+            columns = {**BASE_COLUMNS, **_cache["columns"], **columns}
+        return _load(columns)
+
+
+def refresh():
+    with _lock:
+        _results.clear()
+        _stats["misses"] += 1
+        if PUSHDOWN or _cache["frame"] is None:
+            _cache["version"] += 1
+            views.clear()
+            return None
+    with _load_lock:
+        # An explicit refresh pulls from the database, not only the local snapshot
+        if snapshot.ENABLED:
+            snapshot.sync()
+        return _load({**BASE_COLUMNS, **_cache["columns"]})
+
+
+def _revalidate():
+    if PUSHDOWN or _cache["frame"] is None:
+        return
+    with _load_lock:
+        columns = {**BASE_COLUMNS, **_cache["columns"]}
+        # An unchanged snapshot file means unchanged data: keep the version and its cached views.
+        # Other processes sharing the loader's copy check for a newly published one instead.
+        if (snapshot.ENABLED and _cache["source"] is not None and snapshot.modified() == _cache["source"]
+                and not shared.following()
+                and (not shared.ENABLED or shared.requested_columns().keys() <= columns.keys())):
+            with _lock:
+                _cache["loaded_at"] = time.monotonic()
+            return
+        _load(columns)
+
+
+def _refresh_forever():
+    while True:
+        _wake.wait(REFRESH_INTERVAL)
+        _wake.clear()
+        try:
+            _revalidate()
+            _stats["last_refresh_error"] = None
+        except Exception as exc:
+            # Keep serving the current version until the next attempt
+            _stats["last_refresh_error"] = str(exc)
+            logger.exception("Background refresh failed")
+
+
+def _refresher_running():
+    return _refresher["thread"] is not None and _refresher["thread"].is_alive()
+
+
+# Start the background refresher once per process
+@st.cache_resource
+def start_refresher():
+    thread = threading.Thread(target=_refresh_forever, name="data-refresh", daemon=True)
+    thread.start()
+    _refresher["thread"] = thread
+    return thread
+
+
+def cache_stats():
+    frame = _cache["frame"]
+    loaded = frame is not None
+    return {
+        "version": _cache["version"],
+        "hits": _stats["hits"],
+        "misses": _stats["misses"],
+        "rows": len(frame) if loaded else 0,
+        "memory_bytes": int(frame.memory_usage(deep=True).sum()) if loaded else 0,
+        "age_seconds": time.monotonic() - _cache["loaded_at"] if loaded else None,
+        "last_load_seconds": _stats["last_load_seconds"],
+        "ttl_seconds": CACHE_TTL,
+        "refreshing": _load_lock.locked(),
+        "last_refresh_error": _stats["last_refresh_error"],
+        # Snapshot file the loaded version was read from, if any
+        "source": _cache["source"],
+        "shared": None if not shared.ENABLED else "loader" if shared.is_loader() else "follower",
+    }
+
+
+def data_version():
+    if not PUSHDOWN:
+        load_orders(BASE_COLUMNS)
+    return _cache["version"]
+
+
+def cached_view(dashboard, filters, compute, version=None):
+    # Widget order does not matter, so the same selection always maps to one entry.
+    # Pass the version the caller read to keep the view and its figures on one version.
+    version = data_version() if version is None else version
+    key = (dashboard, frozenset(filters.categories), frozenset(filters.subcategories), version)
+    # A matching precomputed view is read instead of computing it
+    return views.get_or_compute(key, lambda: precompute.lookup(dashboard, filters, _cache["source"]) or compute())
+
+
+def filter_options():
+    # Sorted sub_category1 values under each category, for the cascading sidebar filters
+    if PUSHDOWN:
+        return _pushdown(_filter_children)
+    load_orders(BASE_COLUMNS)
+    return _cache["index"].children
+
+
+def _filter_children():
+    return filter_index.children(queries.filter_options())
+
+
+def filtered_orders(category_selected, subcategory_selected, columns):
+    if PUSHDOWN:
+        return _pushdown(_fetch_typed, tuple(category_selected), tuple(subcategory_selected),
+                         tuple(columns.items()))
+    amazon_orders = load_orders(columns)
+    if not category_selected:
+        return amazon_orders
+    with _lock:
+        # The index of the frame that is current now; a newer one has at least the same columns
+        amazon_orders, index = _cache["frame"], _cache["index"]
+    mask = index.mask(category_selected, subcategory_selected)
+    if mask is None:
+        return amazon_orders
+    return _drop_unused_categories(amazon_orders[mask])
+
+
+def _fetch_typed(category_selected, subcategory_selected, columns):
+    columns = dict(columns)
+    return ingest.load(queries.stream_rows(category_selected, subcategory_selected, list(columns)), columns)
+
+
+def _drop_unused_categories(frame):
+    # Keeps value_counts and groupbys on categorical columns to the rows that are left
+    categorical = [name for name in frame.columns if isinstance(frame[name].dtype, pd.CategoricalDtype)]
+    return frame.assign(**{name: frame[name].cat.remove_unused_categories() for name in categorical})
+
+
+def cube_summary(category_selected, subcategory_selected):
+    # The summary KPIs that are totals of the aggregate cube, available without touching the rows
+    if PUSHDOWN:
+        return _pushdown(queries.summary, tuple(category_selected), tuple(subcategory_selected))
+    totals = aggregate_cube().rollup(category_selected, subcategory_selected)
+    return {name: totals[total] for name, total in CUBE_SUMMARY.items()}
+
+
+def summary(filtered, category_selected, subcategory_selected):
+    kpis = cube_summary(category_selected, subcategory_selected)
+    if PUSHDOWN:
+        return kpis
+    # Exact distinct counts are not additive, so they come from the rows unless estimates will do
+    for name, column in (("unique_products", 'product_id'), ("unique_customers", 'user_id')):
+        if APPROX_DISTINCT:
+            kpis[name] = round(aggregate_cube().distinct(column, category_selected, subcategory_selected))
+        elif column in filtered.columns:
+            kpis[name] = filtered[column].nunique()
+    if APPROX_DISTINCT:
+        kpis["distinct_error"] = hll.relative_error()
+    return kpis
+
+
+def repeat_customers(filtered, category_selected, subcategory_selected):
+    # Per-customer totals and repeat-customer KPIs from the customer store
+    if PUSHDOWN:
+        # Nothing is kept in memory, so the store is built from the filtered rows
+        return customers.CustomerStore.build(filtered).repeat((), ())
+    load_orders(BASE_COLUMNS)
+    return _cache["customers"].repeat(category_selected, subcategory_selected)
+
+
+def distinct_by(column, level, category_selected, subcategory_selected):
+    # Estimated distinct values of column per category or sub_category1 (needs APPROX_DISTINCT)
+    return aggregate_cube().distinct_by(column, level, category_selected, subcategory_selected)
+
+
+def top_n(filtered, group_by, measure, category_selected, subcategory_selected, n=1, agg="sum"):
+    if PUSHDOWN:
+        return _pushdown(queries.top_n, group_by, measure, tuple(category_selected),
+                         tuple(subcategory_selected), n, agg)
+    if group_by in cube.KEYS and measure in cube.MEASURES and agg in ("sum", "mean", "count", "max"):
+        totals = breakdown(group_by, category_selected, subcategory_selected)
+        values = totals.set_index(group_by)[f'{measure}_{agg}'].nlargest(n)
+        return values.rename("value").reset_index()
+    return queries.top_values(filtered, group_by, measure, n, agg)
+
+
+def breakdown(level, category_selected, subcategory_selected):
+    # Orders and per-measure sum/count/mean/max for each category or sub_category1
+    if PUSHDOWN:
+        return _pushdown(queries.breakdown, level, tuple(category_selected), tuple(subcategory_selected))
+    return aggregate_cube().by(level, category_selected, subcategory_selected)
+
+
+def aggregate_cube():
+    # Built with each version, before it is swapped in
+    load_orders(BASE_COLUMNS)
+    return _cache["cube"]
+
+
+# Pushed-down results, kept for the same TTL as the table
+_results = ResultCache(PUSHDOWN_CACHE_BYTES)
+
+
+def _pushdown(query, *args):
+    key = (query.__name__, _cache["version"]) + args
+    hit = _results.get(key)
+    if hit is not None and time.monotonic() - hit[0] < CACHE_TTL:
+        with _lock:
+            _stats["hits"] += 1
+        return hit[1]
+    with _lock:
+        _stats["misses"] += 1
+    with stage(f'sql {query.__name__}'):
+        result = query(*args)
+    _results.put(key, (time.monotonic(), result))
+    return result
@@ -1,19 +1,126 @@
-
-import streamlit as st 
+import streamlit as st
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
 from dotenv import load_dotenv
 
 load_dotenv("encrypted.env")
 
 # Get credentials from environment variables
 username = os.getenv("azure_username")
-password = os.getenv("azure_password") 
+password = os.getenv("azure_password")
 server = os.getenv("azure_server")
 database = os.getenv("azure_db")
 
+# Connection pool settings
+POOL_SIZE = int(os.getenv("azure_pool_size", "5"))
+MAX_OVERFLOW = int(os.getenv("azure_pool_overflow", "10"))
+# Seconds to wait for a free connection before giving up
+POOL_TIMEOUT = float(os.getenv("azure_pool_timeout", "30"))
+# Azure SQL drops idle connections after 30 minutes, so recycle well before that
+POOL_RECYCLE = int(os.getenv("azure_pool_recycle", "1500"))
+PRE_PING = os.getenv("azure_pool_pre_ping", "true").lower() in ("1", "true", "yes")
+LOGIN_TIMEOUT = int(os.getenv("azure_login_timeout", "15"))
+QUERY_TIMEOUT = int(os.getenv("azure_query_timeout", "0"))
+# Connections opened in the background when the engine is created
+WARM_CONNECTIONS = int(os.getenv("azure_pool_warm", "2"))
+
+_lock = threading.Lock()
+_metrics = {"connects": 0, "connect_seconds": 0.0, "connect_max": 0.0, "checkouts": 0, "waits": 0,
+            "wait_seconds": 0.0, "wait_max": 0.0, "invalidations": 0, "warmed": 0}
+
+
+def _record(kind, seconds):
+    with _lock:
+        _metrics[f"{kind}s"] += 1
+        _metrics[f"{kind}_seconds"] += seconds
+        _metrics[f"{kind}_max"] = max(_metrics[f"{kind}_max"], seconds)
+
+
+def _instrument(engine):
+    @event.listens_for(engine, "do_connect")
+    def timed_connect(dialect, conn_rec, cargs, cparams):
+        # New TLS handshake and login, the cost pooling is meant to avoid
+        started = time.perf_counter()
+        connection = dialect.connect(*cargs, **cparams)
+        _record("connect", time.perf_counter() - started)
+        return connection
+
+    @event.listens_for(engine.pool, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        with _lock:
+            _metrics["checkouts"] += 1
+
+    @event.listens_for(engine.pool, "invalidate")
+    def invalidate(dbapi_connection, connection_record, exception):
+        with _lock:
+            _metrics["invalidations"] += 1
+
+
+def warm_up(engine, connections=WARM_CONNECTIONS):
+    # Open the connections side by side, then hand them all back to the pool
+    opened = []
+
+    def open_one():
+        try:
+            opened.append(engine.connect())
+        except Exception:
+            pass
+
+    threads = [threading.Thread(target=open_one, daemon=True) for _ in range(min(connections, POOL_SIZE))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for connection in opened:
+        connection.close()
+    with _lock:
+        _metrics["warmed"] += len(opened)
+
+
 # Create SQLAlchemy engine once
 @st.cache_resource
 def get_engine():
     conn_str = f"mssql+pymssql://{username}:{password}@{server}:1433/{database}"
-    return create_engine(conn_str)
\ No newline at end of file
+    engine = create_engine(
+        conn_str,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=PRE_PING,
+        connect_args={"login_timeout": LOGIN_TIMEOUT, "timeout": QUERY_TIMEOUT},
+    )
+    _instrument(engine)
+    if WARM_CONNECTIONS > 0:
+        threading.Thread(target=warm_up, args=(engine,), daemon=True).start()
+    return engine
+
+
+def connect():
+    # Checks a connection out of the pool, counting it as a wait only when every connection the
+    # pool may open is in use; opening a new one below that limit shows up as a connect instead
+    engine = get_engine()
+    pool = engine.pool
+    exhausted = pool.checkedout() >= pool.size() + MAX_OVERFLOW
+    started = time.perf_counter()
+    connection = engine.connect()
+    if exhausted:
+        _record("wait", time.perf_counter() - started)
+    return connection
+
+
+def pool_stats():
+    pool = get_engine().pool
+    with _lock:
+        stats = dict(_metrics)
+    stats.update({
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "connect_avg": stats["connect_seconds"] / stats["connects"] if stats["connects"] else 0.0,
+        "wait_avg": stats["wait_seconds"] / stats["waits"] if stats["waits"] else 0.0,
+    })
+    return stats
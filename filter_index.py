@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+# Columns the sidebar filters on, both dictionary encoded (categorical) in the loaded frame
+KEYS = ['category', 'sub_category1']
+
+
+def children(pairs):
+    # Sorted sub_category1 values under each category, from distinct (category, sub_category1) pairs
+    tree = {}
+    for category, sub_category in pairs[KEYS].dropna().drop_duplicates().itertuples(index=False):
+        tree.setdefault(category, []).append(sub_category)
+    return {category: sorted(sub_categories) for category, sub_categories in sorted(tree.items())}
+
+
+class FilterIndex:
+    # Row positions grouped by (category, sub_category1) cell, so a selection gathers the rows of
+    # its cells instead of scanning both columns
+    def __init__(self, cells, order, starts, rows):
+        self.cells = cells
+        self.order = order
+        self.starts = starts
+        self.rows = rows
+        self.children = children(cells)
+
+    @classmethod
+    def build(cls, frame):
+        category, sub_category = (frame[key].cat for key in KEYS)
+        category_codes = category.codes.to_numpy().astype(np.int64)
+        sub_codes = sub_category.codes.to_numpy().astype(np.int64)
+        width = len(sub_category.categories)
+        keyed = (category_codes >= 0) & (sub_codes >= 0)
+        pair = np.where(keyed, category_codes * width + sub_codes, -1)
+
+        # Only the pairs that occur become cells, in (category, sub_category1) code order
+        counts = np.bincount(pair[keyed], minlength=len(category.categories) * width)
+        used = np.flatnonzero(counts)
+        dense = np.full(len(counts), len(used), dtype=np.int64)
+        dense[used] = np.arange(len(used))
+        # Rows with a missing key sort last and belong to no cell; with no categories at all, no row does
+        cell = np.where(keyed, dense[np.maximum(pair, 0)], len(used)) if len(dense) else np.zeros(len(frame), np.int64)
+        cell = cell.astype(np.int16 if len(used) < np.iinfo(np.int16).max else np.int32)
+        # Stable, so rows keep their frame order within a cell; a radix sort for int16 codes
+        order = np.argsort(cell, kind='stable')
+        if len(frame) < np.iinfo(np.int32).max:
+            order = order.astype(np.int32)
+
+        cells = pd.DataFrame({
+            'category': category.categories.take(used // width),
+            'sub_category1': sub_category.categories.take(used % width),
+            'orders': counts[used],
+        })
+        starts = np.r_[0, np.cumsum(counts[used])]
+        return cls(cells, order, starts, len(frame))
+
+    def mask(self, category_selected, subcategory_selected):
+        # Boolean row mask of the selection, or None when it keeps every row
+        selected = np.flatnonzero(self.cells['category'].isin(category_selected).to_numpy() &
+                                  self.cells['sub_category1'].isin(subcategory_selected).to_numpy())
+        if self.cells['orders'].to_numpy()[selected].sum() == self.rows:
+            return None
+        mask = np.zeros(self.rows, dtype=bool)
+        for cell in selected:
+            mask[self.order[self.starts[cell]:self.starts[cell + 1]]] = True
+        return mask
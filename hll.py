@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+# 2**14 registers per sketch, about 0.8% standard error
+PRECISION = 14
+
+
+def relative_error(precision=PRECISION):
+    return 1.04 / np.sqrt(1 << precision)
+
+
+def hash_values(values):
+    # Returns a 64-bit hash per row and a mask of the non-null rows.
+    # Categoricals hash each category once and index by code.
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        return pd.util.hash_array(np.asarray(values.cat.categories))[codes], codes >= 0
+    return pd.util.hash_array(values.to_numpy()), values.notna().to_numpy()
+
+
+def _positions(hashes, precision):
+    width = 64 - precision
+    index = (hashes >> np.uint64(width)).astype(np.intp)
+    rest = hashes & np.uint64((1 << width) - 1)
+    # Rank is the position of the leftmost 1-bit in the remaining bits
+    bit_length = np.zeros(len(rest), dtype=np.int64)
+    nonzero = rest > 0
+    bit_length[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64) + 1
+    rank = (width - bit_length + 1).astype(np.uint8)
+    return index, rank
+
+
+def sketch(groups, n_groups, hashes, precision=PRECISION):
+    # One register array per group, groups are integer codes in [0, n_groups)
+    registers = np.zeros((n_groups, 1 << precision), dtype=np.uint8)
+    index, rank = _positions(hashes, precision)
+    np.maximum.at(registers, (groups, index), rank)
+    return registers
+
+
+def merge(registers):
+    registers = np.asarray(registers)
+    if registers.ndim == 1:
+        return registers
+    if len(registers) == 0:
+        return np.zeros(registers.shape[1], dtype=np.uint8)
+    return registers.max(axis=0)
+
+
+def estimate(registers):
+    registers = merge(registers)
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = np.count_nonzero(registers == 0)
+    # Linear counting is more accurate for small cardinalities
+    if raw <= 2.5 * m and zeros:
+        return m * np.log(m / zeros)
+    return float(raw)
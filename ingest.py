@@ -0,0 +1,60 @@
+import os
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Rows fetched from the server per round trip when streaming a result set
+CHUNK_ROWS = int(os.getenv("amazon_chunk_rows", "50000"))
+
+
+def compact(frame, columns):
+    # Declared dtypes, with categories in sorted order as astype('category') would give
+    frame = frame.astype({name: dtype for name, dtype in columns.items() if name in frame.columns})
+    for name, dtype in columns.items():
+        if dtype == 'category' and name in frame.columns:
+            categories = frame[name].cat.categories
+            if not categories.is_monotonic_increasing:
+                frame[name] = frame[name].cat.reorder_categories(categories.sort_values())
+    return frame
+
+
+def _concat(parts):
+    if isinstance(parts[0].dtype, pd.CategoricalDtype):
+        # A chunk where the column is all NULL has object categories; union needs one category dtype
+        common = next((part.cat.categories.dtype for part in parts if len(part.cat.categories)),
+                      parts[0].cat.categories.dtype)
+        parts = [part if part.cat.categories.dtype == common else
+                 pd.Series(pd.Categorical.from_codes(part.cat.codes, part.cat.categories.astype(common)),
+                           name=part.name)
+                 for part in parts]
+        return pd.Series(union_categoricals(parts, sort_categories=True), name=parts[0].name)
+    return pd.concat(parts, ignore_index=True)
+
+
+class ColumnBuffer:
+    # Compact chunks are kept per column and joined one column at a time,
+    # so the peak stays near the size of the final frame
+    def __init__(self, columns):
+        self.columns = columns
+        self.rows = 0
+        self._parts = {}
+
+    def append(self, chunk):
+        chunk = compact(chunk, self.columns)
+        for name in chunk.columns:
+            self._parts.setdefault(name, []).append(chunk[name].reset_index(drop=True))
+        self.rows += len(chunk)
+
+    def frame(self):
+        data = {}
+        for name in list(self._parts):
+            data[name] = _concat(self._parts.pop(name))
+        return pd.DataFrame(data)
+
+
+def load(chunks, columns):
+    # chunks is an iterable of raw frames, e.g. queries.stream_rows()
+    buffer = ColumnBuffer(columns)
+    for chunk in chunks:
+        buffer.append(chunk)
+    return buffer.frame()
@@ -0,0 +1,65 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import streamlit as st
+import profiling
+
+# "off" runs a page's computations one after another; "threads" runs the independent ones
+# in a thread pool; "processes" also builds figures in worker processes, which sidesteps the
+# GIL for Plotly's pure-Python figure code
+MODE = os.getenv("amazon_parallel", "off").lower()
+WORKERS = int(os.getenv("amazon_workers", str(min(8, os.cpu_count() or 1))))
+
+logger = logging.getLogger(__name__)
+_worker = threading.local()
+
+
+def _timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def _thread_initializer():
+    _worker.active = True
+
+
+# One pool of each kind per process, shared by every session
+@st.cache_resource
+def _thread_pool():
+    return ThreadPoolExecutor(WORKERS, thread_name_prefix="compute", initializer=_thread_initializer)
+
+
+@st.cache_resource
+def _process_pool():
+    # Fresh interpreters rather than forks of a process that is running server threads
+    return ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def run_all(tasks, processes=False):
+    # tasks maps a name to a zero-argument callable; results come back in the same order.
+    # Each task is timed as a profiling stage of the current page.
+    # With processes=True the callables must be picklable, e.g. partials of module-level functions.
+    if MODE == "off" or WORKERS < 2 or len(tasks) < 2 or getattr(_worker, "active", False):
+        # Serial, also when already inside a pool thread, so nested calls cannot starve the pool
+        outcomes = {name: _timed(task) for name, task in tasks.items()}
+    else:
+        pool = _process_pool() if processes and MODE == "processes" else _thread_pool()
+        try:
+            futures = {name: pool.submit(_timed, task) for name, task in tasks.items()}
+            outcomes = {name: future.result() for name, future in futures.items()}
+        except BrokenProcessPool:
+            # A worker died or could not start; the next call gets a fresh pool
+            logger.exception("Process pool broke, running %s here", ", ".join(tasks))
+            _process_pool.clear()
+            outcomes = {name: _timed(task) for name, task in tasks.items()}
+    results = {}
+    for name, (result, seconds) in outcomes.items():
+        profiling.record(name, seconds)
+        results[name] = result
+    return results
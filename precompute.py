@@ -0,0 +1,223 @@
+import argparse
+import fcntl
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Precomputed dashboard views: KPIs as JSON, chart frames as Parquet and figures as Plotly JSON,
+# written by `python precompute.py` (e.g. from cron) and served by the app when a selection matches
+STORE_PATH = os.getenv("amazon_precomputed_dir", "snapshots/precomputed")
+# Preset name -> {"categories": [...], "subcategories": [...]}; a missing list means what the sidebar
+# selects by default, so {} is the "everything selected" view
+PRESETS_PATH = os.getenv("amazon_presets", "presets.json")
+DEFAULT_PRESETS = {"all": {}}
+# Without a snapshot to match against, a precomputed view is served for at most this many seconds
+MAX_AGE = float(os.getenv("amazon_precomputed_max_age", "86400"))
+
+# Dashboards with a compute(), by the name their views are cached under
+DASHBOARDS = {
+    "orders": "dashboards.orders_dashboard",
+    "customer": "dashboards.customer_dashboard",
+    "salesperformance": "dashboards.salesperformance_dashboard",
+    "customersatisfaction": "dashboards.customersatisfaction_dashboard",
+}
+
+_lock = threading.Lock()
+# Manifest of the store's current run, read again when the run changes
+_manifest = {"token": None, "created": 0.0, "source": None, "entries": {}}
+
+
+def _path(*parts):
+    return os.path.join(STORE_PATH, *parts)
+
+
+def _key(dashboard, categories, subcategories):
+    return dashboard, frozenset(categories), frozenset(subcategories)
+
+
+def _current():
+    try:
+        with open(_path("current")) as pointer:
+            return pointer.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _entries():
+    token = _current()
+    with _lock:
+        if token == _manifest["token"]:
+            return _manifest
+    if token is None:
+        return None
+    try:
+        with open(_path(token, "manifest.json")) as source:
+            manifest = json.load(source)
+    except FileNotFoundError:
+        return None
+    entries = {_key(entry["dashboard"], entry["categories"], entry["subcategories"]): entry["path"]
+               for entry in manifest["entries"]}
+    with _lock:
+        _manifest.update(token=token, created=manifest["created"], source=manifest["source"], entries=entries)
+        return _manifest
+
+
+def lookup(dashboard, filters, source):
+    # The precomputed DashboardResult for this selection, or None. source is the snapshot the caller
+    # serves (see data.cache_stats); a run from another snapshot, or too old without one, is not used.
+    manifest = _entries()
+    if manifest is None:
+        return None
+    if source is not None or manifest["source"] is not None:
+        if manifest["source"] != source:
+            return None
+    elif time.time() - manifest["created"] > MAX_AGE:
+        return None
+    path = manifest["entries"].get(_key(dashboard, filters.categories, filters.subcategories))
+    if path is None:
+        return None
+    from dashboards.base import DashboardResult
+    try:
+        return _read(_path(manifest["token"], path), DashboardResult)
+    except FileNotFoundError:
+        # Removed by a newer run
+        return None
+
+
+def _read(directory, result_type):
+    with open(os.path.join(directory, "view.json")) as source:
+        view = json.load(source)
+    charts = {name: pd.read_parquet(os.path.join(directory, file)) for name, file in view["charts"].items()}
+    return result_type(kpis=view["kpis"], charts=charts, figures=view["figures"])
+
+
+def _write(directory, result):
+    os.makedirs(directory)
+    charts = {}
+    for i, (name, frame) in enumerate(result.charts.items()):
+        charts[name] = f"chart{i}.parquet"
+        frame.to_parquet(os.path.join(directory, charts[name]))
+    with open(os.path.join(directory, "view.json"), "w") as out:
+        # NumPy scalars as plain numbers
+        json.dump({"kpis": result.kpis, "charts": charts, "figures": result.figures}, out,
+                  default=lambda value: value.item())
+
+
+def load_presets(path=PRESETS_PATH):
+    if not os.path.exists(path):
+        return DEFAULT_PRESETS
+    with open(path) as source:
+        return json.load(source)
+
+
+def resolve(preset, options):
+    # Filters for a preset, filled in the way the sidebar fills in its defaults
+    from dashboards.base import Filters
+    from dashboards.filters import subcategories_under
+    categories = preset.get("categories", list(options))
+    subcategories = preset.get("subcategories", subcategories_under(options, categories))
+    return Filters.of(categories, subcategories)
+
+
+def _export(dashboard, filters, directory):
+    # One view: computed, with its figures built, and written to directory
+    import charts
+    import data
+    module = importlib.import_module(DASHBOARDS[dashboard])
+    started = time.perf_counter()
+    result = module.compute(data, filters)
+    result.figures = {name: charts.serialize(build, result.charts) for name, build in module.FIGURES.items()}
+    _write(directory, result)
+    return time.perf_counter() - started
+
+
+def _worker_initializer():
+    # Connections opened before the fork belong to the parent
+    import data
+    import db
+    if data.PUSHDOWN:
+        db.get_engine().dispose(close=False)
+
+
+def run(presets, dashboards, workers):
+    import data
+    # Loaded once here, then shared with forked workers
+    if not data.PUSHDOWN:
+        columns = {}
+        for dashboard in dashboards:
+            columns.update(importlib.import_module(DASHBOARDS[dashboard]).COLUMNS)
+        data.load_orders(columns)
+    options = data.filter_options()
+    source = data.cache_stats()["source"]
+
+    token = uuid.uuid4().hex
+    tasks = []
+    for name, preset in presets.items():
+        filters = resolve(preset, options)
+        for dashboard in dashboards:
+            path = f"{dashboard}-{len(tasks)}"
+            tasks.append(({"dashboard": dashboard, "preset": name, "categories": list(filters.categories),
+                           "subcategories": list(filters.subcategories), "path": path},
+                          (dashboard, filters, _path(token, path))))
+
+    if workers > 1 and len(tasks) > 1 and "fork" in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"),
+                                 initializer=_worker_initializer) as pool:
+            seconds = list(pool.map(_export, *zip(*(arguments for _, arguments in tasks))))
+    else:
+        seconds = [_export(*arguments) for _, arguments in tasks]
+    for (entry, _), elapsed in zip(tasks, seconds):
+        logger.info("%s / %s in %.2fs", entry["dashboard"], entry["preset"], elapsed)
+
+    os.makedirs(_path(token), exist_ok=True)
+    with open(_path(token, "manifest.json"), "w") as out:
+        json.dump({"created": time.time(), "source": source, "entries": [entry for entry, _ in tasks]}, out)
+    previous = _current()
+    with open(_path("current.tmp"), "w") as pointer:
+        pointer.write(token)
+    os.replace(_path("current.tmp"), _path("current"))
+    # A running app may still be reading the previous run
+    for name in os.listdir(STORE_PATH):
+        if name not in (token, previous) and os.path.isdir(_path(name)):
+            shutil.rmtree(_path(name), ignore_errors=True)
+    return len(tasks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute dashboard views for filter presets")
+    parser.add_argument("--presets", default=PRESETS_PATH, help="JSON file of presets (default: every category)")
+    parser.add_argument("--dashboard", dest="dashboards", action="append", choices=list(DASHBOARDS),
+                        help="dashboards to precompute (default all)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="views computed side by side, in forked processes")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    os.makedirs(STORE_PATH, exist_ok=True)
+    with open(_path("run.lock"), "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Still running from the previous schedule
+            logger.warning("Another precompute run holds %s, skipping", _path("run.lock"))
+            return 0
+        started = time.perf_counter()
+        views = run(load_presets(args.presets), args.dashboards or list(DASHBOARDS), args.workers)
+        logger.info("Wrote %d views to %s in %.1fs", views, STORE_PATH, time.perf_counter() - started)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
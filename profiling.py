@@ -0,0 +1,159 @@
+import contextvars
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Extra capture per page run: "cprofile", "tracemalloc" or both, comma separated
+CAPTURE = {name.strip() for name in os.getenv("amazon_profile", "").split(",") if name.strip()}
+# Users who see the performance panel in the sidebar
+ADMIN_USERS = {name.strip() for name in os.getenv("amazon_admin_users", "").split(",") if name.strip()}
+# Optional JSON lines file every timing is appended to
+LOG_PATH = os.getenv("amazon_profile_log", "")
+# Timings kept per (page, stage) for the percentiles, and in the exportable log
+MAX_SAMPLES = int(os.getenv("amazon_profile_samples", "500"))
+
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_log = deque(maxlen=MAX_SAMPLES * 20)
+# Last cProfile report and allocation peak per page
+_captures = {}
+# Only one cProfile profiler can be active in the process at a time
+_profiler_lock = threading.Lock()
+
+_page = contextvars.ContextVar("page", default="(no page)")
+_run_peak = contextvars.ContextVar("run_peak", default=None)
+
+
+def _record(page, name, seconds):
+    record = {"time": time.time(), "page": page, "stage": name, "ms": seconds * 1000, "peak_mb": None}
+    if tracemalloc.is_tracing():
+        # Highest traced allocation since the previous stage ended
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        record["peak_mb"] = peak / 1048576
+        run_peak = _run_peak.get()
+        if run_peak is not None:
+            run_peak[0] = max(run_peak[0], peak)
+    with _lock:
+        _samples[(page, name)].append(record["ms"])
+        _log.append(record)
+    if LOG_PATH:
+        with open(LOG_PATH, "a") as log:
+            log.write(json.dumps(record) + "\n")
+
+
+def record(name, seconds):
+    # For stages timed elsewhere, e.g. in a worker pool
+    _record(_page.get(), name, seconds)
+
+
+@contextmanager
+def stage(name):
+    # Wall time of one step of the current page's run, e.g. a query, a groupby or a chart
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(_page.get(), name, time.perf_counter() - started)
+
+
+def stopwatch():
+    # lap(name) records the time since the previous lap, so a render can be timed
+    # step by step without wrapping each step in a block
+    last = [time.perf_counter()]
+    page = _page.get()
+
+    def lap(name):
+        now = time.perf_counter()
+        _record(page, name, now - last[0])
+        last[0] = now
+
+    return lap
+
+
+@contextmanager
+def run(page):
+    # One render of a page: stages inside it are recorded under this page
+    token = _page.set(page)
+    profiler = None
+    if "cprofile" in CAPTURE and _profiler_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        profiler.enable()
+    traced = "tracemalloc" in CAPTURE or tracemalloc.is_tracing()
+    if traced:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        peak_token = _run_peak.set([0])
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(page, "total", time.perf_counter() - started)
+        capture = {}
+        if traced:
+            capture["peak_bytes"] = _run_peak.get()[0] - baseline
+            _run_peak.reset(peak_token)
+        if profiler is not None:
+            profiler.disable()
+            _profiler_lock.release()
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(25)
+            capture["profile"] = report.getvalue()
+        if capture:
+            with _lock:
+                _captures[page] = dict(capture, time=time.time())
+        _page.reset(token)
+
+
+def _percentile(ordered, share):
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+def percentiles():
+    with _lock:
+        samples = {key: sorted(values) for key, values in _samples.items()}
+    return [
+        {"page": page, "stage": name, "runs": len(values), "p50_ms": _percentile(values, 0.5),
+         "p95_ms": _percentile(values, 0.95), "max_ms": values[-1]}
+        for (page, name), values in sorted(samples.items())
+    ]
+
+
+def captures():
+    with _lock:
+        return dict(_captures)
+
+
+def records():
+    with _lock:
+        return list(_log)
+
+
+def export_json():
+    return json.dumps(records())
+
+
+def export_csv():
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=["time", "page", "stage", "ms", "peak_mb"])
+    writer.writeheader()
+    with _lock:
+        writer.writerows(_log)
+    return output.getvalue()
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _log.clear()
+        _captures.clear()
@@ -0,0 +1,111 @@
+import contextvars
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+import streamlit as st
+import charts
+import data
+import parallel
+from profiling import stopwatch
+
+# Fill a page's KPIs and charts as each becomes ready, instead of after the slowest one
+ENABLED = os.getenv("amazon_progressive", "false").lower() == "true"
+# Seconds a chart may take before a sampled approximation is shown until the exact one is ready
+BUDGET = float(os.getenv("amazon_chart_budget", "2"))
+# About this many rows go into an approximation
+SAMPLE_ROWS = int(os.getenv("amazon_progressive_sample_rows", "250000"))
+
+
+# One pool per process, apart from parallel's so these can wait on work that runs there
+@st.cache_resource
+def _pool():
+    return ThreadPoolExecutor(max(4, parallel.WORKERS), thread_name_prefix="progressive")
+
+
+def _submit(func, *args):
+    # Keeps the page's profiling context in the pool thread
+    return _pool().submit(contextvars.copy_context().run, func, *args)
+
+
+class SampledData:
+    # Stands in for the data module in a page's compute(): filtered_orders() keeps every order of
+    # a sample of products, so per-product values stay exact for the products that are drawn.
+    # Everything else comes from the data module as is.
+    def __init__(self, source, rows):
+        self.source = source
+        self.rows = rows
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+    def filtered_orders(self, category_selected, subcategory_selected, columns):
+        frame = self.source.filtered_orders(category_selected, subcategory_selected, columns)
+        if len(frame) <= self.rows:
+            return frame
+        step = -(-len(frame) // self.rows)
+        return frame[frame['product_id'].cat.codes.to_numpy() % step == 0]
+
+
+def _sampled(build, frames):
+    fig = build(frames)
+    fig.update_layout(title_text=f"{fig.layout.title.text or ''} (sampled, loading…)")
+    return fig
+
+
+def fill(dashboard, filters, version, compute, quick, builders, quick_figures, show_kpis, slots, exact_only=()):
+    # compute and quick are the page's compute functions, quick covering only what the aggregate cube
+    # answers; quick_figures are the builders its charts are enough for. show_kpis(kpis) writes the
+    # KPIs it has values for, and slots holds an st.empty() per figure. exact_only are figures a
+    # product sample says nothing reliable about (top-N rankings and their shares), which keep
+    # their placeholder until the exact one is ready.
+    lap = stopwatch()
+    started = time.perf_counter()
+    for slot in slots.values():
+        slot.caption("⏳ Loading chart…")
+    full = _submit(data.cached_view, dashboard, filters, lambda: compute(data, filters), version)
+
+    early = quick(data, filters)
+    show_kpis(early.kpis)
+    early_specs = charts.figure_specs(dashboard, filters, version, {name: builders[name] for name in quick_figures},
+                                      early.charts)
+    for name, spec in early_specs.items():
+        charts.plotly_chart(slots[name], spec, width="stretch")
+    lap('quick')
+
+    pending = [name for name in builders if name not in quick_figures]
+    exact = {}
+    sampled = False
+    while pending:
+        waiting = list(exact) or [full]
+        timeout = None if sampled else max(0.0, started + BUDGET - time.perf_counter())
+        done, _ = wait(waiting, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # Over budget: approximations from a product sample until the exact charts arrive
+            sampled = True
+            approximated = [name for name in pending if name not in exact_only]
+            if not approximated:
+                continue
+            view = data.cached_view(f'{dashboard} sample', filters,
+                                    lambda: compute(SampledData(data, SAMPLE_ROWS), filters), version)
+            specs = charts.figure_specs(f'{dashboard} sample', filters, version,
+                                        {name: partial(_sampled, builders[name]) for name in approximated},
+                                        view.charts)
+            for name in approximated:
+                charts.plotly_chart(slots[name], specs[name], width="stretch")
+            lap('sampled')
+            continue
+        if full in done:
+            result = full.result()
+            show_kpis(result.kpis)
+            lap('compute')
+            # Each chart on its own, so it is shown as soon as it is built
+            exact = {_submit(charts.figure_specs, dashboard, filters, version, {name: builders[name]},
+                             result.charts, result.figures): name for name in pending}
+            continue
+        for future in done:
+            name = exact.pop(future)
+            charts.plotly_chart(slots[name], future.result()[name], width="stretch")
+            pending.remove(name)
+            lap(f'{name} render')
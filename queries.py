@@ -0,0 +1,99 @@
+import pandas as pd
+from sqlalchemy import Float, cast, column, func, literal_column, select, table
+from db import connect
+from ingest import CHUNK_ROWS
+
+TABLE = "CleanedAmazonData"
+
+AGGREGATES = {
+    "sum": func.sum,
+    "mean": lambda col: func.avg(cast(col, Float)),
+    "count": func.count,
+    "nunique": lambda col: func.count(col.distinct()),
+    "max": func.max,
+}
+
+
+def _source():
+    return table(TABLE)
+
+
+def _where(query, category_selected, subcategory_selected):
+    # Same semantics as the dashboards: no category selected means no filter
+    if not category_selected:
+        return query
+    return query.where(column("category").in_(list(category_selected)),
+                       column("sub_category1").in_(list(subcategory_selected)))
+
+
+def _read(query):
+    with connect() as conn:
+        return pd.read_sql(query, conn)
+
+
+def _stream(query, chunk_rows):
+    # pymssql has no server-side cursors; its cursor is unbuffered and fetchmany() reads rows off
+    # the connection as they are asked for, so about chunk_rows rows are held on the client at a time
+    with connect() as conn:
+        yield from pd.read_sql(query, conn, chunksize=chunk_rows)
+
+
+def filter_options():
+    query = select(column("category"), column("sub_category1")).distinct().select_from(_source())
+    return _read(query)
+
+
+def stream_rows(category_selected, subcategory_selected, columns=None, chunk_rows=CHUNK_ROWS):
+    fields = [column(name) for name in columns] if columns else [literal_column("*")]
+    query = _where(select(*fields).select_from(_source()), category_selected, subcategory_selected)
+    return _stream(query, chunk_rows)
+
+
+def stream_changes(watermark_column, since=None, chunk_rows=CHUNK_ROWS):
+    # Rows added or modified after the given watermark (all rows when None)
+    query = select(literal_column("*")).select_from(_source())
+    if since is not None:
+        query = query.where(column(watermark_column) > since)
+    return _stream(query, chunk_rows)
+
+
+def summary(category_selected, subcategory_selected):
+    query = select(
+        func.count().label("orders"),
+        func.count(column("product_id").distinct()).label("unique_products"),
+        func.count(column("user_id").distinct()).label("unique_customers"),
+        func.count(column("category").distinct()).label("unique_categories"),
+        func.count(column("sub_category1").distinct()).label("unique_subcategories"),
+        func.sum(column("selling_price")).label("total_sales"),
+        func.avg(cast(column("selling_price"), Float)).label("avg_price"),
+        func.max(column("selling_price")).label("max_price"),
+        func.avg(cast(column("discount_percentage"), Float)).label("avg_discount"),
+        func.avg(cast(column("rating"), Float)).label("avg_rating"),
+    ).select_from(_source())
+    return _read(_where(query, category_selected, subcategory_selected)).to_dict("records")[0]
+
+
+def breakdown(level, category_selected, subcategory_selected):
+    fields = [func.count().label("orders")]
+    for measure in ("selling_price", "discount_percentage", "rating"):
+        fields += [
+            func.sum(column(measure)).label(f"{measure}_sum"),
+            func.count(column(measure)).label(f"{measure}_count"),
+            func.avg(cast(column(measure), Float)).label(f"{measure}_mean"),
+            func.max(column(measure)).label(f"{measure}_max"),
+        ]
+    query = select(column(level), *fields).select_from(_source()).group_by(column(level)).order_by(column(level))
+    return _read(_where(query, category_selected, subcategory_selected))
+
+
+def top_n(group_by, measure, category_selected, subcategory_selected, n=1, agg="sum"):
+    value = AGGREGATES[agg](column(measure)).label("value")
+    query = (select(column(group_by), value).select_from(_source())
+             .group_by(column(group_by)).order_by(value.desc()).limit(n))
+    return _read(_where(query, category_selected, subcategory_selected))
+
+
+# Local equivalent, used when the table is already held in memory
+def top_values(frame, group_by, measure, n=1, agg="sum"):
+    values = frame.groupby(group_by, observed=True)[measure].agg(agg).nlargest(n)
+    return values.rename("value").reset_index()
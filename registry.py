@@ -0,0 +1,52 @@
+import importlib
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Page name -> dashboard module; a module is imported the first time its page is opened
+DASHBOARDS = {
+    "Orders Dashboard": "dashboards.orders_dashboard",
+    "Customer Dashboard": "dashboards.customer_dashboard",
+    "Product Sales Performance Dashboard": "dashboards.salesperformance_dashboard",
+    "Customer Satisfaction Dashboard": "dashboards.customersatisfaction_dashboard",
+    "Power BI Dashboards": "dashboards.powerbi_dashboards",
+}
+
+# Process-wide startup timings in seconds, kept for the lifetime of the worker
+_lock = threading.Lock()
+_timings = {"loaded_at": time.time(), "imports": {}, "first_paint": {}}
+
+
+def load(page):
+    name = DASHBOARDS[page]
+    if name not in sys.modules:
+        started = time.perf_counter()
+        importlib.import_module(name)
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _timings["imports"].setdefault(name, elapsed)
+        logger.info("Imported %s in %.3fs", name, elapsed)
+    return sys.modules[name].render
+
+
+def record_paint(page, started):
+    # started is the perf_counter() reading taken when the script run began
+    elapsed = time.perf_counter() - started
+    with _lock:
+        first = page not in _timings["first_paint"]
+        if first:
+            _timings["first_paint"][page] = elapsed
+    if first:
+        logger.info("First paint of %s in %.3fs", page, elapsed)
+
+
+def timings():
+    with _lock:
+        return {
+            "uptime": time.time() - _timings["loaded_at"],
+            "imports": dict(_timings["imports"]),
+            "first_paint": dict(_timings["first_paint"]),
+        }
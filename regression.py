@@ -0,0 +1,70 @@
+import numpy as np
+
+Z_95 = 1.959963984540054
+# Two-sided 95% Student's t quantiles for 1-30 degrees of freedom
+T_95 = [12.7062, 4.3027, 3.1824, 2.7764, 2.5706, 2.4469, 2.3646, 2.3060, 2.2622, 2.2281,
+        2.2010, 2.1788, 2.1604, 2.1448, 2.1314, 2.1199, 2.1098, 2.1009, 2.0930, 2.0860,
+        2.0796, 2.0739, 2.0687, 2.0639, 2.0595, 2.0555, 2.0518, 2.0484, 2.0452, 2.0423]
+
+
+def _t_critical(df, z=Z_95):
+    if df <= 0:
+        return np.nan
+    if df <= len(T_95):
+        return T_95[df - 1]
+    # Cornish-Fisher expansion, within 1e-4 of the exact quantile past 30 degrees of freedom
+    return (z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3))
+
+
+def _clean(x, y):
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    present = ~(np.isnan(x) | np.isnan(y))
+    if present.all():
+        return x, y
+    return x[present], y[present]
+
+
+def _ols(x, y):
+    n = len(x)
+    if n < 2:
+        return None
+    x_mean, y_mean = x.mean(), y.mean()
+    dx, dy = x - x_mean, y - y_mean
+    sxx, sxy, syy = dx @ dx, dx @ dy, dy @ dy
+    if sxx == 0:
+        return None
+    slope = sxy / sxx
+    residual_ss = max(syy - slope * sxy, 0.0)
+    residual_std = np.sqrt(residual_ss / (n - 2)) if n > 2 else np.nan
+    return {
+        "slope": slope,
+        "intercept": y_mean - slope * x_mean,
+        "r2": sxy * sxy / (sxx * syy) if syy else 1.0,
+        "n": n,
+        "x_mean": x_mean,
+        "sxx": sxx,
+        "residual_std": residual_std,
+        "slope_se": residual_std / np.sqrt(sxx),
+        "x_min": x.min(),
+        "x_max": x.max(),
+    }
+
+
+def ols(x, y):
+    # Closed-form simple linear regression over the rows where both values are present
+    return _ols(*_clean(x, y))
+
+
+def predict(result, xs):
+    return result["intercept"] + result["slope"] * np.asarray(xs, dtype='float64')
+
+
+def confidence_band(result, xs):
+    # 95% confidence interval of the fitted mean at each x
+    xs = np.asarray(xs, dtype='float64')
+    half_width = (_t_critical(result["n"] - 2) * result["residual_std"]
+                  * np.sqrt(1 / result["n"] + (xs - result["x_mean"]) ** 2 / result["sxx"]))
+    fitted = predict(result, xs)
+    return fitted - half_width, fitted + half_width
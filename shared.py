@@ -0,0 +1,147 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import pickle
+import shutil
+import stat
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Serve every Streamlit process on the host from one loaded copy of the data, published by
+# whichever process holds the loader lock and memory-mapped by the rest
+ENABLED = os.getenv("amazon_shared_plane", "false").lower() == "true"
+# Best on a RAM-backed filesystem, so the published version lives in shared memory
+DIRECTORY = os.getenv("amazon_shared_dir", "/dev/shm/amazon-dashboards")
+# Seconds a process waits for the loader's first version before loading a copy of its own
+WAIT = float(os.getenv("amazon_shared_wait", "60"))
+
+# Array buffers start on cache-line boundaries in the mapped file
+ALIGN = 64
+
+_loader = {"handle": None}
+
+
+def _path(*parts):
+    return os.path.join(DIRECTORY, *parts)
+
+
+def _directory():
+    # Every process unpickles what is found here, so it must be this user's and closed to others
+    os.makedirs(DIRECTORY, mode=0o700, exist_ok=True)
+    info = os.stat(DIRECTORY)
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{DIRECTORY} must be owned by this user and not writable by others")
+    return DIRECTORY
+
+
+def is_loader():
+    # The first process to take the lock loads and publishes for the host. The kernel releases it
+    # when that process exits, and the next process to ask takes over.
+    if _loader["handle"] is None:
+        _directory()
+        handle = open(_path("loader.lock"), "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return False
+        _loader["handle"] = handle
+    return True
+
+
+def following():
+    return ENABLED and not is_loader()
+
+
+def current():
+    # Token of the latest published version, or None before the first publish
+    try:
+        with open(_path("current")) as pointer:
+            return pointer.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish(state):
+    # Pickle protocol 5 hands every NumPy and Arrow buffer over out of band; they are written
+    # into one file next to the small in-band pickle, and mapped back without a copy by attach()
+    _directory()
+    buffers = []
+    head = pickle.dumps(state, protocol=5, buffer_callback=buffers.append)
+    token = uuid.uuid4().hex
+    os.makedirs(_path(token))
+    layout = []
+    offset = 0
+    with open(_path(token, "buffers"), "wb") as out:
+        for buffer in buffers:
+            view = buffer.raw()
+            padding = -offset % ALIGN
+            out.write(b"\0" * padding)
+            offset += padding
+            out.write(view)
+            layout.append((offset, view.nbytes))
+            offset += view.nbytes
+    with open(_path(token, "head"), "wb") as out:
+        pickle.dump((layout, head), out, protocol=5)
+
+    previous = current()
+    with open(_path("current.tmp"), "w") as pointer:
+        pointer.write(token)
+    os.replace(_path("current.tmp"), _path("current"))
+    # Processes that already mapped an older version keep it until they let go; its files only
+    # lose their names here. The previous one stays for processes that just read the pointer.
+    for name in os.listdir(DIRECTORY):
+        if name not in (token, previous) and os.path.isdir(_path(name)):
+            shutil.rmtree(_path(name), ignore_errors=True)
+    return token
+
+
+def attach(token):
+    # The published state, with its arrays read-only views of the shared file
+    _directory()
+    with open(_path(token, "head"), "rb") as source:
+        layout, head = pickle.load(source)
+    with open(_path(token, "buffers"), "rb") as source:
+        if os.fstat(source.fileno()).st_size:
+            view = memoryview(mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ))
+        else:
+            view = memoryview(b"")
+    return pickle.loads(head, buffers=[view[offset:offset + size] for offset, size in layout])
+
+
+def wait_for_version():
+    # Token of the loader's latest version, waiting for the first one; None when this process
+    # became the loader meanwhile or the wait ran out
+    deadline = time.monotonic() + WAIT
+    while not is_loader():
+        token = current()
+        if token is not None:
+            return token
+        if time.monotonic() >= deadline:
+            logger.warning("No shared data version after %.0fs, loading a private copy", WAIT)
+            return None
+        time.sleep(0.5)
+    return None
+
+
+def request_columns(columns):
+    # Columns a page needs beyond the published ones; the loader adds them on its next load
+    _directory()
+    with open(_path("columns.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        wanted = {**requested_columns(), **columns}
+        with open(_path("columns.tmp"), "w") as out:
+            json.dump(wanted, out)
+        os.replace(_path("columns.tmp"), _path("columns.json"))
+
+
+def requested_columns():
+    try:
+        with open(_path("columns.json")) as source:
+            return json.load(source)
+    except FileNotFoundError:
+        return {}
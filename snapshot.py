@@ -0,0 +1,176 @@
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import streamlit as st
+import queries
+import shared
+
+logger = logging.getLogger(__name__)
+
+# Local Arrow IPC copy of CleanedAmazonData, memory-mapped when read
+ENABLED = os.getenv("amazon_snapshot", "true").lower() == "true"
+SNAPSHOT_PATH = os.getenv("amazon_snapshot_path", "snapshots/CleanedAmazonData.arrow")
+# Column that increases whenever a row is added or changed (datetime or rowversion)
+WATERMARK_COLUMN = os.getenv("amazon_watermark_column", "last_modified")
+# Key that identifies a row, so a changed row replaces its old copy. Syncs are incremental only
+# when it is set; without it a changed row cannot be told from a new one, so every sync is a full pull.
+KEY_COLUMN = os.getenv("amazon_key_column", "")
+SYNC_INTERVAL = float(os.getenv("amazon_snapshot_sync_interval", "300"))
+
+_sync_lock = threading.Lock()
+_status = {"last_sync": None, "last_error": None, "rows_synced": 0}
+
+
+def _open():
+    return pa.ipc.open_file(pa.memory_map(SNAPSHOT_PATH, "r")).read_all()
+
+
+def _directory():
+    directory = os.path.dirname(SNAPSHOT_PATH) or "."
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+@contextmanager
+def _locked():
+    # One sync at a time across threads, and across the Streamlit processes sharing the file
+    _directory()
+    with _sync_lock, open(SNAPSHOT_PATH + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _write(snapshot, lineage):
+    snapshot = snapshot.replace_schema_metadata({**(snapshot.schema.metadata or {}), b"lineage": lineage.encode()})
+    handle, tmp_path = tempfile.mkstemp(dir=_directory(), prefix=os.path.basename(SNAPSHOT_PATH) + ".")
+    os.close(handle)
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, snapshot.schema) as writer:
+                writer.write_table(snapshot)
+        # Readers holding the old file keep their mapping; new readers see the new one
+        os.replace(tmp_path, SNAPSHOT_PATH)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _merge(snapshot, changes):
+    changes = changes.cast(snapshot.schema)
+    replaced = pc.is_in(snapshot[KEY_COLUMN], value_set=changes[KEY_COLUMN])
+    return pa.concat_tables([snapshot.filter(pc.invert(replaced)), changes])
+
+
+def _pull(since=None):
+    # Each chunk becomes Arrow as soon as it arrives, so at most one chunk is held as pandas objects
+    tables = [pa.Table.from_pandas(chunk, preserve_index=False)
+              for chunk in queries.stream_changes(WATERMARK_COLUMN, since)]
+    return pa.concat_tables(tables, promote_options="permissive")
+
+
+def sync():
+    # Without a watermark and a key column every sync is a full pull
+    with _locked():
+        return _sync()
+
+
+def _sync():
+    snapshot = _open() if os.path.exists(SNAPSHOT_PATH) else None
+    incremental = (snapshot is not None and bool(KEY_COLUMN) and WATERMARK_COLUMN in snapshot.column_names
+                   and KEY_COLUMN in snapshot.column_names)
+    since = pc.max(snapshot[WATERMARK_COLUMN]).as_py() if incremental else None
+    fetched = _pull(since)
+    _status.update(last_sync=time.time(), last_error=None, rows_synced=fetched.num_rows)
+    # A new lineage unless the file only gains rows at the end
+    lineage = uuid.uuid4().hex
+    if not incremental:
+        if snapshot is not None and fetched.equals(snapshot):
+            # Unchanged: keep the file, so its mtime and lineage and everything keyed on them stay valid
+            return snapshot
+        snapshot = fetched
+    elif fetched.num_rows == 0:
+        return snapshot
+    else:
+        try:
+            merged = _merge(snapshot, fetched)
+            if merged.num_rows == snapshot.num_rows + fetched.num_rows:
+                lineage = _lineage(snapshot.schema) or lineage
+            snapshot = merged
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # Schema drifted since the last full pull, start over
+            logger.warning("Snapshot schema changed, rebuilding from a full pull")
+            snapshot = _pull()
+    _write(snapshot, lineage)
+    return snapshot
+
+
+def read(columns):
+    # columns maps names to dtypes; converting in Arrow avoids a full-width pandas copy per column
+    if not os.path.exists(SNAPSHOT_PATH):
+        with _locked():
+            # Another process may have written it while this one waited for the lock
+            if not os.path.exists(SNAPSHOT_PATH):
+                _sync()
+    table = _open().select(list(columns))
+    for name, dtype in columns.items():
+        if dtype == 'category':
+            converted = pc.dictionary_encode(table[name])
+        elif dtype in ('float32', 'float64', 'int32', 'int64'):
+            converted = pc.cast(table[name], pa.type_for_alias(dtype))
+        else:
+            continue
+        table = table.set_column(table.schema.get_field_index(name), name, converted)
+    return table.to_pandas()
+
+
+def _lineage(schema):
+    value = (schema.metadata or {}).get(b"lineage")
+    return value.decode() if value else None
+
+
+def lineage():
+    # Stays the same while syncs only append rows, so a reader can apply just the rows past the
+    # ones it has already seen
+    if not os.path.exists(SNAPSHOT_PATH):
+        return None
+    return _lineage(pa.ipc.open_file(pa.memory_map(SNAPSHOT_PATH, "r")).schema)
+
+
+def modified():
+    # Changes whenever a sync writes a new file
+    return os.stat(SNAPSHOT_PATH).st_mtime_ns if os.path.exists(SNAPSHOT_PATH) else None
+
+
+def status():
+    return dict(_status, path=SNAPSHOT_PATH,
+                bytes=os.path.getsize(SNAPSHOT_PATH) if os.path.exists(SNAPSHOT_PATH) else 0)
+
+
+def _sync_forever():
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        if shared.following():
+            # The loader process syncs the file for the whole host
+            continue
+        try:
+            sync()
+        except Exception as exc:
+            # Keep serving the last good snapshot while the database is unavailable
+            _status["last_error"] = str(exc)
+            logger.exception("Snapshot sync failed")
+
+
+# Start the scheduled sync once per process
+@st.cache_resource
+def start_scheduler():
+    thread = threading.Thread(target=_sync_forever, name="snapshot-sync", daemon=True)
+    thread.start()
+    return thread